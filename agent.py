@@ -1,14 +1,19 @@
 import asyncio
 import logging
 import os
-from typing import List
-
-import weave
+import re
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 
+from analysis_cache import AnalysisCache
 from retriever import Retriever, rerank_docs
-from utils import (FAST_LLM, STRONG_LLM, Analysis, Problem, Reflection,
-                   Solution, async_client, check_correctness, format_example,
-                   format_examples, format_response)
+from stages import StageCache
+from tracing import annotate_error, traced_op
+from utils import (FAST_LLM, STRONG_LLM, Analysis, PatchError, Problem,
+                   Reflection, Solution, TestReport, apply_patch, async_client,
+                   check_correctness, compact_test_report, format_example,
+                   format_examples, format_response, number_lines)
 
 logging.basicConfig(
     format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
@@ -17,6 +22,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 MAX_TOKENS = os.getenv("MAX_TOKENS", 4096)
+ANALYSIS_CACHE = os.getenv("ANALYSIS_CACHE", "data/cache/analyses.jsonl")
 # BASE_URL = os.getenv("BASE_URL", None)
 
 SOLVER_INSTRUCTIONS = """You are a world-class competitive programmer tasked with solving a programming problem. 
@@ -71,7 +77,7 @@ Competition Guidelines:
 """
 
 
-@weave.op
+@traced_op
 async def draft_solution(
     problem: Problem, model: str = FAST_LLM, temperature: float = 0.0
 ) -> Solution:
@@ -102,7 +108,7 @@ Let's think step by step to solve the problem:
     except Exception as e:
         err_msg = f"Error formatting response: {e}"
         logger.error(err_msg)
-        raise_in_weave(raise_error=True, msg=err_msg)
+        annotate_error(err_msg)
         return Solution(
             core_question=err_msg,
             problem_solving_info=[err_msg],
@@ -149,8 +155,15 @@ Finally, generate the pseudocode to solve the problem.
 """
 
 
-@weave.op
+analysis_cache = AnalysisCache(Path(ANALYSIS_CACHE))
+
+
+@traced_op
 async def analyze_and_plan(example: dict, temperature: float = 0.7) -> Analysis:
+    cached_analysis = analysis_cache.get(example)
+    if cached_analysis is not None:
+        return cached_analysis
+
     user_prompt = f"""{format_example(example)}
 
 Let's think step by step to analyze the problem and plan a solution to the problem:
@@ -173,11 +186,12 @@ Let's think step by step to analyze the problem and plan a solution to the probl
             model=Analysis,
             temperature=temperature
         )
+        analysis_cache.put(example, formatted_response)
         return formatted_response
     except Exception as e:
         err_msg = f"Error formatting response: {e}"
         logger.error(err_msg)
-        raise_in_weave(raise_error=True, msg=err_msg)
+        annotate_error(err_msg)
         return Analysis(
             core_question=err_msg,
             problem_solving_info=[err_msg],
@@ -188,7 +202,7 @@ Let's think step by step to analyze the problem and plan a solution to the probl
         )
 
 
-@weave.op
+@traced_op
 async def analyze_and_plan_solutions(docs: List[dict], temperature: float = 0.7) -> List[Analysis]:
     '''
     Create analysis for a list of solutions.
@@ -200,7 +214,7 @@ async def analyze_and_plan_solutions(docs: List[dict], temperature: float = 0.7)
     return descriptions
 
 
-@weave.op
+@traced_op
 async def generate_solution(
     problem: Problem, examples: str, model: str = STRONG_LLM, temperature: float = 0.0
 ) -> Solution:
@@ -241,7 +255,7 @@ Let's think step by step to solve the problem:
     except Exception as e:
         err_msg = f"Error formatting response: {e}"
         logger.error(err_msg)
-        raise_in_weave(raise_error=True, msg=err_msg)
+        annotate_error(err_msg)
         return Solution(
             core_question=err_msg,
             problem_solving_info=[err_msg],
@@ -297,7 +311,7 @@ Let's think step by step to reflect on the problem:
 """
 
 
-@weave.op
+@traced_op
 async def reflection(
     problem: Problem,
     incorrect_solution: Solution,
@@ -329,7 +343,7 @@ async def reflection(
     except Exception as e:
         err_msg = f"Error formatting response: {e}"
         logger.error(err_msg)
-        raise_in_weave(raise_error=True, msg=err_msg)
+        annotate_error(err_msg)
         return Reflection(
             reflection=err_msg,
             keywords=err_msg,
@@ -338,20 +352,7 @@ async def reflection(
             general_advice=err_msg,
         )
 
-@weave.op
-def raise_in_weave(raise_error: bool = False, msg: str = ""):
-    """
-    Show an error message in Weave while continuing execution.
-    """
-    try:
-        if raise_error:
-            raise Exception(msg)
-        else:
-            pass
-    except Exception as e:
-        pass
-
-@weave.op
+@traced_op
 async def improve_solution(
     problem: Problem,
     incorrect_solution: Solution,
@@ -396,7 +397,7 @@ Let's think step by step to solve the problem correctly:
         return formatted_response
     except Exception as e:
         err_msg = f"Error formatting response: {e}"
-        raise_in_weave(raise_error=True, msg=err_msg)
+        annotate_error(err_msg)
         logger.error(err_msg)
         return Solution(
             core_question=err_msg,
@@ -408,11 +409,157 @@ Let's think step by step to solve the problem correctly:
             source_code=err_msg,
         )
 
-@weave.op
+PATCH_INSTRUCTIONS = """You are a world-class competitive programmer fixing a Python3 solution to a programming problem.
+You will be given the problem, the current solution with line numbers, a report of how it failed
+on the sample tests and instructions from a reflection on the failure.
+
+Answer with a unified diff against the current solution and nothing else:
+    a. Start every hunk with a header like `@@ -12,3 +12,4 @@` using the given line numbers.
+    b. Prefix context lines with a space, removed lines with `-` and added lines with `+`.
+    c. Do not include the line numbers or the ` | ` separator in the diff lines.
+    d. Change only what is needed to fix the failure and keep the output format unchanged.
+"""
+
+
+@traced_op
+async def patch_solution(
+    problem: Problem,
+    incorrect_solution: Solution,
+    test_report: Any,
+    reflections: Reflection,
+    model: str = STRONG_LLM,
+    temperature: float = 0.0,
+) -> Solution:
+    """
+    A compact variant of `improve_solution`: sends the numbered code, a bounded test diff and the
+    actionable reflection fields and applies the unified diff the model answers with. Falls back
+    to `improve_solution` when the patch doesn't apply.
+    """
+    user_prompt = f"""{problem.as_xml}
+<current_solution>
+{number_lines(incorrect_solution.source_code)}
+</current_solution>
+<test_report>
+{compact_test_report(test_report)}
+</test_report>
+<reflection>
+{reflections.actionable_xml}
+</reflection>
+"""
+    response = await async_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": PATCH_INSTRUCTIONS},
+            {"role": "user", "content": user_prompt},
+        ],
+        response_model=None,
+        temperature=temperature,
+        max_tokens=MAX_TOKENS,
+        max_retries=2
+    )
+    try:
+        source_code = apply_patch(
+            incorrect_solution.source_code, response.choices[0].message.content
+        )
+    except PatchError as e:
+        logger.info(f"Patch could not be applied, regenerating the full solution: {e}")
+        return await improve_solution(
+            problem=problem,
+            incorrect_solution=incorrect_solution,
+            test_report=test_report,
+            reflections=reflections,
+            model=model,
+            temperature=temperature,
+        )
+    return incorrect_solution.model_copy(update={"source_code": source_code})
+
+
+OPTIMIZE_INSTRUCTIONS = """Your previous solution is correct on the sample test cases but too slow on the full input.
+
+<performance_report>
+<runtime>{runtime}</runtime>
+<time_budget>{time_budget:.0f} seconds</time_budget>
+<input_size>{input_size}</input_size>
+<constraints>
+{constraints}
+</constraints>
+</performance_report>
+
+Work out the time complexity of your solution and the complexity the constraints require.
+Then rewrite the solution with an asymptotically faster algorithm, or remove the constant factor
+overheads (slow input parsing, recursion, repeated work) if the complexity is already right.
+Keep the output format exactly the same.
+
+---
+Let's think step by step to solve the problem efficiently:
+"""
+
+
+def extract_constraints(problem_description: str) -> str:
+    match = re.search(
+        r"^#+\s*Constraints\s*\n(.*?)(?=^#+ |\Z)", problem_description, re.DOTALL | re.MULTILINE
+    )
+    return match.group(1).strip() if match else "Not specified"
+
+
+def describe_input(input_data: str) -> str:
+    first_line = input_data.split("\n", 1)[0].strip()
+    return (
+        f"{len(input_data.encode()) / 1024:.0f} KiB, {input_data.count(chr(10))} lines, "
+        f"T = {first_line}"
+    )
+
+
+@traced_op
+async def optimize_solution(
+    problem: Problem,
+    slow_solution: Solution,
+    runtime: str,
+    time_budget: float,
+    input_size: str,
+    model: str = STRONG_LLM,
+    temperature: float = 0.0,
+) -> Solution:
+    """A variant of `improve_solution` that rewrites a correct but slow solution for speed."""
+    messages = [
+        {"role": "system", "content": SOLVER_INSTRUCTIONS},
+        {"role": "user", "content": problem.as_xml},
+        {"role": "assistant", "content": slow_solution.as_xml},
+        {
+            "role": "user",
+            "content": OPTIMIZE_INSTRUCTIONS.format(
+                runtime=runtime,
+                time_budget=time_budget,
+                input_size=input_size,
+                constraints=extract_constraints(problem.problem_description),
+            ),
+        },
+    ]
+    response = await async_client.chat.completions.create(
+        model=model,
+        messages=messages,
+        response_model=None,
+        temperature=temperature,
+        max_tokens=MAX_TOKENS,
+        max_retries=2
+    )
+    try:
+        return await format_response(
+            text=response.choices[0].message.content,
+            model=Solution,
+            temperature=temperature
+        )
+    except Exception as e:
+        err_msg = f"Error formatting response: {e}"
+        annotate_error(err_msg)
+        logger.error(err_msg)
+        return slow_solution
+
+@traced_op
 async def zero_shot_solver(
     problem: Problem, model: str = FAST_LLM, temperature: float = 0.7, timeout: int = 10
 ) -> dict:
-    logger.info("Drafting intial zero-shot solution")
+    logger.info("Drafting initial zero-shot solution")
     solution = await draft_solution(
         problem=problem,
         model=model,
@@ -425,30 +572,40 @@ async def zero_shot_solver(
     return {"solution": solution, "stage": "zero-shot", "test_report": test_report}
 
 
-@weave.op
+@traced_op
 async def rag_solver(
     retriever: Retriever,
     problem: Problem,
     model: str = FAST_LLM,
     temperature: float = 0.0,
     timeout: int = 10,
+    stages: Optional[StageCache] = None,
+    iteration: int = 0,
 ) -> dict:
-    zero_shot_result = await zero_shot_solver(
-        problem=problem,
-        model=model,
-        temperature=temperature,
-        timeout=timeout,
+    # stages memoized in `stages` are only recomputed when their inputs change, generation is
+    # resampled every iteration
+    stages = stages or StageCache()
+    logger.info("Drafting initial zero-shot solution")
+    solution = await stages.run(
+        "draft", draft_solution, problem=problem, model=model, temperature=temperature
     )
-    solution = zero_shot_result["solution"]
     assert isinstance(solution, Solution), "solution must be a Solution object"
     assert solution.source_code, "solution does not contain source_code"
 
-    test_report = zero_shot_result["test_report"]
-    if test_report == "passed":
-        return zero_shot_result
+    test_report = await stages.run(
+        "test",
+        check_correctness,
+        solution.source_code,
+        problem.sample_input,
+        problem.sample_output,
+        timeout,
+    )
+    logger.info(f"Draft solution result: {repr(test_report)}")
+    if test_report.status == "passed":
+        return {"solution": solution, "stage": "zero-shot", "test_report": test_report}
     logger.info("Iterating on a RAG solution")
 
-    @weave.op
+    @traced_op
     async def generate_sample_solutions_from_code_dataset(
         problem: Problem,
         solution: Solution,
@@ -463,13 +620,23 @@ async def rag_solver(
         assert isinstance(problem, Problem), "Problem must be a Problem object"
         assert isinstance(solution, Solution), "Solution must be a Solution object"
         assert solution.source_code, "Solution does not contain source_code"
-        retrieve_docs = retriever.retrieve(solution.source_code, top_k)
-        reranked_docs = await rerank_docs(problem, solution, retrieve_docs, top_n)
-        analyses = await analyze_and_plan_solutions(reranked_docs, temperature)
+        retrieve_docs = await stages.run(
+            "retrieve",
+            retriever.retrieve,
+            solution.source_code,
+            top_k,
+            dense_query=problem.problem_description + " " + solution.source_code,
+        )
+        reranked_docs = await stages.run(
+            "rerank", rerank_docs, problem, solution, retrieve_docs, top_n
+        )
+        analyses = await stages.run(
+            "analyze", analyze_and_plan_solutions, reranked_docs, temperature
+        )
         examplars = format_examples(reranked_docs, analyses)
         return examplars
 
-    @weave.op
+    @traced_op
     async def rag_solution(
         problem: Problem,
         draft_solution: Solution,
@@ -483,13 +650,18 @@ async def rag_solver(
             solution=draft_solution,
             temperature=temperature
         )
-        rag_solution = await generate_solution(
+        rag_solution = await stages.run(
+            "generate",
+            generate_solution,
             problem=problem,
             examples=examplars,
             model=model,
             temperature=temperature,
+            salt=iteration,
         )
-        test_report = await check_correctness(
+        test_report = await stages.run(
+            "test",
+            check_correctness,
             rag_solution.source_code,
             problem.sample_input,
             problem.sample_output,
@@ -504,7 +676,7 @@ async def rag_solver(
     return {"solution": solution, "stage": "rag", "test_report": test_report}
 
 
-@weave.op
+@traced_op
 async def rework_solution(
     problem: Problem,
     incorrect_solution: Solution,
@@ -512,24 +684,37 @@ async def rework_solution(
     model: str = STRONG_LLM,
     temperature: float = 0.0,
     timeout: int = 10,
+    stages: Optional[StageCache] = None,
+    iteration: int = 0,
+    patch: bool = True,
 ) -> dict:
+    stages = stages or StageCache()
     logger.info(f"Reflecting and improving solution")
-    reflections = await reflection(
+    reflections = await stages.run(
+        "reflect",
+        reflection,
         problem=problem,
         incorrect_solution=incorrect_solution,
         test_report=test_report,
         model=model,
         temperature=temperature,
+        salt=iteration,
     )
-    improved_solution = await improve_solution(
+    # patches keep refinement turns small, the full protocol resends every field
+    improved_solution = await stages.run(
+        "improve",
+        patch_solution if patch else improve_solution,
         problem=problem,
         incorrect_solution=incorrect_solution,
         test_report=test_report,
         reflections=reflections,
         model=model,
         temperature=temperature,
+        salt=iteration,
     )
-    test_report = await check_correctness(
+    test_report = await stages.run(
+        "test",
+        check_correctness,
         improved_solution.source_code,
         problem.sample_input,
         problem.sample_output,
@@ -538,7 +723,162 @@ async def rework_solution(
     logger.info(f"Reworked solution result: {repr(test_report)}")
     return {"solution": improved_solution, "test_report": test_report}
 
-@weave.op
+
+async def check_full_input(
+    program: str, input_data: str, expected_output: str, timeout: float
+) -> TestReport:
+    """
+    `check_correctness` on the full input. A failing report's message would hold the whole
+    expected output and stdout, so it is compacted before it is checkpointed or returned.
+    """
+    test_report = await check_correctness(program, input_data, expected_output, timeout)
+    if test_report.status == "passed":
+        return test_report
+    return test_report.model_copy(update={"message": compact_test_report(test_report)})
+
+
+@traced_op
+async def performance_rework(
+    problem: Problem,
+    solution: Solution,
+    test_report: TestReport,
+    time_budget: float,
+    max_iterations: int = 2,
+    model: str = STRONG_LLM,
+    temperature: float = 0.0,
+    sample_timeout: int = 10,
+    stages: Optional[StageCache] = None,
+) -> dict:
+    """
+    Runs a solution that passes the samples on the full input within `time_budget` seconds and,
+    while it is too slow, asks for a faster version given the measured runtime, input size and
+    constraints. Rewrites that break the samples are discarded.
+    """
+    stages = stages or StageCache()
+    input_data = problem.problem_input.read_text()
+    expected_output = problem.problem_output.read_text()
+    input_size = describe_input(input_data)
+
+    full_report = await stages.run(
+        "full_test", check_full_input, solution.source_code, input_data, expected_output, time_budget
+    )
+    for iteration in range(max_iterations):
+        if full_report.status != "timeout":
+            break
+        logger.info(
+            f"Solution exceeded the {time_budget:.0f}s budget on the full input, optimizing "
+            f"(iteration {iteration}). Problem: {problem.problem_name}"
+        )
+        candidate = await stages.run(
+            "optimize",
+            optimize_solution,
+            problem=problem,
+            slow_solution=solution,
+            runtime=f"timed out after {full_report.runtime:.1f} seconds",
+            time_budget=time_budget,
+            input_size=input_size,
+            model=model,
+            temperature=temperature,
+            salt=iteration,
+        )
+        sample_report = await stages.run(
+            "test",
+            check_correctness,
+            candidate.source_code,
+            problem.sample_input,
+            problem.sample_output,
+            sample_timeout,
+        )
+        if sample_report.status != "passed":
+            logger.info(f"Optimized solution broke the samples: {sample_report.status}")
+            continue
+        solution, test_report = candidate, sample_report
+        full_report = await stages.run(
+            "full_test", check_full_input, solution.source_code, input_data, expected_output, time_budget
+        )
+    logger.info(
+        f"Full input result: {full_report.status} in {full_report.runtime or 0:.1f}s. "
+        f"Problem: {problem.problem_name}"
+    )
+    return {"solution": solution, "test_report": test_report, "full_test_report": full_report}
+
+
+async def check_performance(
+    problem: Problem,
+    result: dict,
+    time_budget: Optional[float],
+    model: str,
+    temperature: float,
+    timeout: int,
+    stages: StageCache,
+) -> dict:
+    """Runs the performance stage on a passing result when a full-input time budget is set."""
+    if time_budget is None or result["test_report"].status != "passed":
+        return result
+    performance = await performance_rework(
+        problem=problem,
+        solution=result["solution"],
+        test_report=result["test_report"],
+        time_budget=time_budget,
+        model=model,
+        temperature=temperature,
+        sample_timeout=timeout,
+        stages=stages,
+    )
+    return {**result, **performance}
+
+
+def remember_solution(retriever: Retriever, problem: Problem, solution: Solution):
+    """
+    Add a passing solution to the retriever so later problems can use it as an exemplar.
+    """
+    retriever.add(
+        [
+            {
+                "description": problem.problem_description,
+                "code": solution.source_code,
+                "sample_inputs": problem.sample_input,
+                "sample_outputs": problem.sample_output,
+            }
+        ]
+    )
+
+async def race_branches(branches: Dict[str, Awaitable[dict]]) -> Tuple[Optional[str], List[Tuple[str, dict]]]:
+    """
+    Run solver branches concurrently, returning as soon as one passes and cancelling the rest.
+    Returns the name of the passing branch (or None) and every finished branch's result.
+    """
+    tasks = {asyncio.ensure_future(branch): name for name, branch in branches.items()}
+    pending = set(tasks)
+    finished = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    logger.error(f"Branch {tasks[task]} failed: {task.exception()}")
+                    continue
+                finished.append((tasks[task], task.result()))
+                if task.result()["test_report"].status == "passed":
+                    return tasks[task], finished
+        return None, finished
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+# prefer reworking candidates that ran to completion over ones that crashed or timed out
+STATUS_PRIORITY = {"passed": 0, "failed": 1, "timeout": 2, "error": 3}
+
+
+def candidate_rank(candidate: Tuple[str, dict]) -> Tuple[float, int]:
+    """Sort key preferring near-miss candidates: most sample cases passed, then the best status."""
+    test_report = candidate[1]["test_report"]
+    return (-test_report.partial_credit, STATUS_PRIORITY.get(test_report.status, 4))
+
+
+@traced_op
 async def rag_solver_with_reflection(
         retriever: Retriever,
         problem: Problem,
@@ -546,7 +886,25 @@ async def rag_solver_with_reflection(
         temperature: float = 0.7,
         max_iterations: int = 2,
         code_execution_timeout: int = 10,
+        speculative: bool = False,
+        stages: Optional[StageCache] = None,
+        time_budget: Optional[float] = None,
+        remember: bool = True,  # add passing solutions to the retriever for later problems
 ):
+    if speculative:
+        return await speculative_rag_solver(
+            retriever=retriever,
+            problem=problem,
+            model=model,
+            temperature=temperature,
+            max_iterations=max_iterations,
+            code_execution_timeout=code_execution_timeout,
+            stages=stages,
+            time_budget=time_budget,
+            remember=remember,
+        )
+
+    stages = stages or StageCache()
     num_iterations = 0
     while num_iterations < max_iterations:
         rag_result = await rag_solver(
@@ -555,11 +913,19 @@ async def rag_solver_with_reflection(
             timeout=code_execution_timeout,
             model=model,
             temperature=temperature,
+            stages=stages,
+            iteration=num_iterations,
         )
         solution, test_report = rag_result["solution"], rag_result["test_report"]
         if test_report.status == "passed":
             logger.info(f"Passing solution generated successfully for problem: {problem.problem_name}")
-            return rag_result
+            rag_result = await check_performance(
+                problem, rag_result, time_budget, model, temperature, code_execution_timeout, stages
+            )
+            if remember:
+                remember_solution(retriever, problem, rag_result["solution"])
+            stages.log_report()
+            return {**rag_result, "stage_report": stages.report()}
         
         logger.info(f"Solution failed, reworking solution. Problem: {problem.problem_name}")
         rework_result = await rework_solution(
@@ -569,16 +935,129 @@ async def rag_solver_with_reflection(
             model=model,
             temperature=temperature,
             timeout=code_execution_timeout,
+            stages=stages,
+            iteration=num_iterations,
         )
         solution, test_report = rework_result["solution"], rework_result["test_report"]
         if test_report.status == "passed":
             logger.info(f"Re-worked solution passed for problem: {problem.problem_name}")
+            rework_result = await check_performance(
+                problem, rework_result, time_budget, model, temperature, code_execution_timeout, stages
+            )
+            if remember:
+                remember_solution(retriever, problem, rework_result["solution"])
+            stages.log_report()
             return {
-                "solution": solution,
+                **rework_result,
                 "stage": "reflection",
-                "test_report": test_report,
+                "stage_report": stages.report(),
             }
         num_iterations += 1
         logger.info(f"Re-worked solution failed, trying iteration {num_iterations}. Problem: {problem.problem_name}")
     logger.info("Failed to generate a solution after {num_iterations} iterations. Problem: {problem.problem_name}")
-    return {"solution": solution, "stage": "failed", "test_report": test_report}
\ No newline at end of file
+    stages.log_report()
+    return {
+        "solution": solution,
+        "stage": "failed",
+        "test_report": test_report,
+        "stage_report": stages.report(),
+    }
+
+
+@traced_op
+async def speculative_rag_solver(
+        retriever: Retriever,
+        problem: Problem,
+        model: str = FAST_LLM,
+        temperature: float = 0.7,
+        max_iterations: int = 2,
+        code_execution_timeout: int = 10,
+        stages: Optional[StageCache] = None,
+        time_budget: Optional[float] = None,
+        remember: bool = True,
+):
+    """
+    Like `rag_solver_with_reflection`, but after a failure reworks the solution and generates a
+    fresh RAG solution concurrently, keeping whichever passes first.
+    """
+    stages = stages or StageCache()
+    start = time.perf_counter()
+    rag_result = await rag_solver(
+        retriever=retriever,
+        problem=problem,
+        timeout=code_execution_timeout,
+        model=model,
+        temperature=temperature,
+        stages=stages,
+    )
+    candidates = [("rag", rag_result)]
+    for num_iterations in range(max_iterations):
+        stage, result = min(candidates, key=candidate_rank)
+        if result["test_report"].status == "passed":
+            logger.info(
+                f"Passing {stage} solution after {time.perf_counter() - start:.1f}s "
+                f"for problem: {problem.problem_name}"
+            )
+            result = await check_performance(
+                problem, result, time_budget, model, temperature, code_execution_timeout, stages
+            )
+            if remember:
+                remember_solution(retriever, problem, result["solution"])
+            stages.log_report()
+            return {
+                **result,
+                "stage": stage,
+                "candidates": [(stage, c["test_report"]) for stage, c in candidates],
+                "stage_report": stages.report(),
+            }
+
+        logger.info(f"Solution failed, racing rework and fresh RAG branches. Problem: {problem.problem_name}")
+        test_report = result["test_report"]
+        if len(candidates) > 1:
+            # both candidates' reports go to the next round's rework
+            test_report = "\n".join(
+                f"<{name}_candidate>{c['test_report'].as_xml}</{name}_candidate>"
+                for name, c in candidates
+            )
+        _, finished = await race_branches(
+            {
+                "reflection": rework_solution(
+                    problem=problem,
+                    incorrect_solution=result["solution"],
+                    test_report=test_report,
+                    model=model,
+                    temperature=temperature,
+                    timeout=code_execution_timeout,
+                    stages=stages,
+                    iteration=num_iterations,
+                ),
+                "rag": rag_solver(
+                    retriever=retriever,
+                    problem=problem,
+                    timeout=code_execution_timeout,
+                    model=model,
+                    temperature=temperature,
+                    stages=stages,
+                    iteration=num_iterations + 1,
+                ),
+            }
+        )
+        candidates = finished or candidates
+
+    stage, result = min(candidates, key=candidate_rank)
+    if result["test_report"].status == "passed":
+        result = await check_performance(
+            problem, result, time_budget, model, temperature, code_execution_timeout, stages
+        )
+        if remember:
+            remember_solution(retriever, problem, result["solution"])
+    else:
+        logger.info(f"Failed to generate a solution after {max_iterations} iterations. Problem: {problem.problem_name}")
+        stage = "failed"
+    stages.log_report()
+    return {
+        **result,
+        "stage": stage,
+        "candidates": [(name, c["test_report"]) for name, c in candidates],
+        "stage_report": stages.report(),
+    }
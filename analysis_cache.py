@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import simple_parsing
+
+from metrics import metrics
+from utils import Analysis
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def doc_key(doc: dict) -> str:
+    """Content hash of a corpus doc, stable across doc stores and reindexing."""
+    content = doc["description"] + "\0" + doc["code"]
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed store of `Analysis` objects for corpus docs, persisted as an
+    append-only JSONL file so every analysis is paid for once.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.analyses: Dict[str, Analysis] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            with path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a write cut short by a crash
+                        continue
+                    self.analyses[record["key"]] = Analysis(**record["analysis"])
+            logger.info(f"Loaded {len(self.analyses)} cached analyses from {path}")
+
+    def __len__(self) -> int:
+        return len(self.analyses)
+
+    def __contains__(self, doc: dict) -> bool:
+        return doc_key(doc) in self.analyses
+
+    def get(self, doc: dict) -> Optional[Analysis]:
+        analysis = self.analyses.get(doc_key(doc))
+        if analysis is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        metrics.inc("cache_lookups", cache="analysis", result="miss" if analysis is None else "hit")
+        return analysis
+
+    def put(self, doc: dict, analysis: Analysis):
+        key = doc_key(doc)
+        with self._lock:
+            if key in self.analyses:
+                return
+            self.analyses[key] = analysis
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                record = {"key": key, "analysis": analysis.model_dump()}
+                with self.path.open("a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+
+def most_retrieved_docs(
+    retriever, num_queries: int = 2000, k: int = 50, top_n: int = 500, seed: int = 0
+) -> List[dict]:
+    """
+    Approximates the most frequently retrieved docs by running a sample of corpus solutions
+    through the retriever and counting how often each doc comes back.
+    """
+    rng = random.Random(seed)
+    doc_ids = rng.sample(range(len(retriever.docs)), min(num_queries, len(retriever.docs)))
+    queries = [doc["code"] for doc in retriever.docs.take(doc_ids)]
+    counts = Counter(
+        doc["doc_id"] for docs in retriever.retrieve_many(queries, k) for doc in docs
+    )
+    return retriever.take([doc_id for doc_id, _ in counts.most_common(top_n)])
+
+
+async def prewarm(
+    cache: AnalysisCache,
+    docs: List[dict],
+    analyze: Callable[[dict], Awaitable[Analysis]],
+    max_concurrency: int = 8,
+):
+    """Analyzes every doc that isn't cached yet with bounded concurrency; `analyze` fills the cache."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    missing = [doc for doc in docs if doc not in cache]
+    logger.info(f"Pre-warming {len(missing)} of {len(docs)} docs")
+
+    async def run(doc: dict):
+        async with semaphore:
+            await analyze(doc)
+
+    await asyncio.gather(*[run(doc) for doc in missing])
+    logger.info(f"Analysis cache holds {len(cache)} docs")
+
+
+@dataclass
+class ScriptArgs:
+    """Pre-warm the analysis cache for the most frequently retrieved docs. Example usage:
+    python analysis_cache.py --top_n 500 --max_concurrency 8
+    """
+    num_queries: int = 2000  # corpus solutions used to estimate retrieval frequency
+    k: int = 50  # retrieval depth, matching the agent's top_k
+    top_n: int = 500  # number of most retrieved docs to analyze
+    max_concurrency: int = 8  # concurrent analysis calls
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    from agent import analysis_cache, analyze_and_plan
+    from retriever import Retriever
+
+    docs = most_retrieved_docs(Retriever(), args.num_queries, args.k, args.top_n)
+    asyncio.run(prewarm(analysis_cache, docs, analyze_and_plan, args.max_concurrency))
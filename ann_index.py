@@ -0,0 +1,174 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import simple_parsing
+from sklearn.cluster import MiniBatchKMeans
+
+from embeddings import load_corpus_embeddings
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    indices = np.argpartition(-scores, k - 1)[:k]
+    return indices[np.argsort(-scores[indices])]
+
+
+def brute_force_search(
+    embeddings: np.ndarray, query: np.ndarray, k: int = 10, chunk_size: int = 65536
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact inner-product search, streamed over the (memory-mapped) matrix in chunks."""
+    query = query.astype(np.float32)
+    scores = np.concatenate(
+        [
+            embeddings[start : start + chunk_size].astype(np.float32) @ query
+            for start in range(0, len(embeddings), chunk_size)
+        ]
+    )
+    ids = top_k(scores, k)
+    return ids, scores[ids]
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized embeddings. A k-means quantizer splits the corpus into
+    lists and a query is only scored exactly against the docs in its `n_probe` closest lists.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        ids: np.ndarray,
+        offsets: np.ndarray,
+        embeddings: np.ndarray,
+    ):
+        self.centroids = centroids
+        # doc ids grouped by list, list `i` is ids[offsets[i]:offsets[i + 1]]
+        self.ids = ids
+        self.offsets = offsets
+        self.embeddings = embeddings
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        sample_size: int = 100_000,
+        chunk_size: int = 65536,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        n_lists = n_lists or int(4 * math.sqrt(len(embeddings)))
+        logger.info(f"Building IVF index with {n_lists} lists over {len(embeddings)} docs")
+        rng = np.random.default_rng(seed)
+        sample = np.sort(
+            rng.choice(len(embeddings), min(sample_size, len(embeddings)), replace=False)
+        )
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_lists, batch_size=4096, n_init=1, random_state=seed
+        )
+        kmeans.fit(embeddings[sample].astype(np.float32))
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+
+        assignments = np.concatenate(
+            [
+                np.argmax(
+                    embeddings[start : start + chunk_size].astype(np.float32) @ centroids.T,
+                    axis=1,
+                )
+                for start in range(0, len(embeddings), chunk_size)
+            ]
+        )
+        ids = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[ids], np.arange(n_lists + 1))
+        return cls(centroids, ids, offsets, embeddings)
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray) -> "IVFIndex":
+        logger.info(f"Loading IVF index from {path}")
+        data = np.load(path)
+        return cls(data["centroids"], data["ids"], data["offsets"], embeddings)
+
+    def save(self, path: Path):
+        logger.info(f"Saving IVF index to {path}")
+        np.savez(path, centroids=self.centroids, ids=self.ids, offsets=self.offsets)
+
+    def search(
+        self, query: np.ndarray, k: int = 10, n_probe: int = 8
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        query = query.astype(np.float32)
+        lists = top_k(self.centroids @ query, n_probe)
+        # sorted ids keep the gather from the memory-mapped matrix mostly sequential
+        candidates = np.sort(
+            np.concatenate([self.ids[self.offsets[i] : self.offsets[i + 1]] for i in lists])
+        )
+        scores = self.embeddings[candidates].astype(np.float32) @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+def benchmark(
+    index: IVFIndex,
+    embeddings: np.ndarray,
+    num_queries: int = 200,
+    k: int = 50,
+    n_probe: int = 8,
+    seed: int = 0,
+) -> dict:
+    """Latency and recall@k of the IVF index against brute-force search, using corpus rows as queries."""
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), num_queries, replace=False)]
+    exact_times, ann_times, recalls = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact_ids, _ = brute_force_search(embeddings, query, k)
+        exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ann_ids, _ = index.search(query, k, n_probe)
+        ann_times.append(time.perf_counter() - start)
+        recalls.append(len(set(exact_ids) & set(ann_ids)) / len(exact_ids))
+
+    return {
+        f"recall@{k}": float(np.mean(recalls)),
+        "brute_force_ms": 1000 * float(np.mean(exact_times)),
+        "brute_force_p95_ms": 1000 * float(np.percentile(exact_times, 95)),
+        "ivf_ms": 1000 * float(np.mean(ann_times)),
+        "ivf_p95_ms": 1000 * float(np.percentile(ann_times, 95)),
+    }
+
+
+@dataclass
+class ScriptArgs:
+    """Build the IVF index over the corpus embeddings and benchmark it against brute force. Example usage:
+    python ann_index.py --embeddings data/cache/corpus_embeddings.npy --output data/cache/ivf_index.npz
+    """
+    embeddings: Path = Path("data/cache/corpus_embeddings.npy")  # precomputed by embeddings.py
+    output: Path = Path("data/cache/ivf_index.npz")  # where to write the index
+    n_lists: Optional[int] = None  # number of k-means lists, defaults to 4 * sqrt(num_docs)
+    n_probe: int = 8  # lists scanned per query
+    k: int = 50  # depth used for recall@k
+    num_queries: int = 200  # queries sampled from the corpus for the benchmark
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    embeddings = load_corpus_embeddings(args.embeddings)
+    if embeddings is None:
+        raise FileNotFoundError(f"No corpus embeddings at {args.embeddings}, run embeddings.py first")
+    index = IVFIndex.build(embeddings, n_lists=args.n_lists)
+    index.save(args.output)
+    for n_probe in sorted({1, args.n_probe // 2 or 1, args.n_probe, args.n_probe * 2}):
+        results = benchmark(index, embeddings, args.num_queries, args.k, n_probe)
+        logger.info(f"n_probe={n_probe}: {results}")
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import simple_parsing
+import weave
+
+from agent import rag_solver_with_reflection
+from metrics import metrics
+from retriever import Retriever
+from stages import StageCache
+from utils import FAST_LLM, Problem, find_problems
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RunLog:
+    """
+    Append-only JSONL log of finished problems. Every stage output of a problem in progress is
+    checkpointed next to it, so a restarted run skips finished problems and resumes the others
+    from their last completed stage.
+    """
+
+    def __init__(self, run_dir: Path):
+        self.run_dir = run_dir
+        self.results_path = run_dir / "results.jsonl"
+        self.results: Dict[str, dict] = {}
+        if self.results_path.exists():
+            with self.results_path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.results[record["problem_name"]] = record
+
+    def stages(self, problem: Problem) -> StageCache:
+        return StageCache(self.run_dir / "stages" / f"{problem.problem_name}.jsonl")
+
+    def record(self, problem: Problem, result: dict) -> dict:
+        test_report = result["test_report"]
+        full_test_report = result.get("full_test_report")
+        record = {
+            "problem_name": problem.problem_name,
+            "stage": result["stage"],
+            "status": test_report.status,
+            "passed_cases": test_report.passed_cases,
+            "total_cases": test_report.total_cases,
+            "runtime": test_report.runtime,
+            "full_status": full_test_report.status if full_test_report else None,
+            "full_runtime": full_test_report.runtime if full_test_report else None,
+            "source_code": result["solution"].source_code,
+            "stage_report": result.get("stage_report"),
+        }
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        with self.results_path.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.results[problem.problem_name] = record
+        return record
+
+
+async def run_batch(
+    problems: List[Problem],
+    retriever: Retriever,
+    run_log: RunLog,
+    max_workers: int = 4,
+    **solver_kwargs,
+) -> List[dict]:
+    """
+    Solves the problems that aren't finished in `run_log` with at most `max_workers` running at
+    once, logging and recording each result as soon as it completes.
+    """
+    pending = [p for p in problems if p.problem_name not in run_log.results]
+    logger.info(
+        f"{len(problems) - len(pending)} of {len(problems)} problems already finished, "
+        f"solving {len(pending)} with {max_workers} workers"
+    )
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def solve(problem: Problem) -> Optional[dict]:
+        async with semaphore:
+            try:
+                result = await rag_solver_with_reflection(
+                    retriever=retriever,
+                    problem=problem,
+                    stages=run_log.stages(problem),
+                    **solver_kwargs,
+                )
+            except Exception as e:
+                # nothing is recorded, so the next run retries from the stage checkpoint
+                logger.error(f"Failed to solve problem {problem.problem_name}: {e}")
+                return None
+            return run_log.record(problem, result)
+
+    records = []
+    for future in asyncio.as_completed([solve(problem) for problem in pending]):
+        record = await future
+        if record is None:
+            continue
+        records.append(record)
+        logger.info(
+            f"[{len(records)}/{len(pending)}] {record['problem_name']}: {record['status']} "
+            f"({record['passed_cases']}/{record['total_cases']} sample cases, stage {record['stage']})"
+        )
+    return records
+
+
+@dataclass
+class ScriptArgs:
+    """Solve a folder of problems concurrently, resuming from the checkpoints of an earlier run. Example usage:
+    python batch_runner.py --problems_folder 2024/practice --run_dir data/runs/practice --max_workers 4
+    """
+    problems_folder: Path = Path("2024/practice")  # folder searched for problems
+    run_dir: Path = Path("data/runs/practice")  # results and stage checkpoints, reuse it to resume
+    max_workers: int = 4  # problems solved concurrently
+    model: str = FAST_LLM  # model used by the solver
+    temperature: float = 0.7  # sampling temperature
+    max_iterations: int = 2  # reflection iterations per problem
+    timeout: int = 10  # code execution timeout in seconds
+    speculative: bool = False  # race rework and fresh RAG branches after a failure
+    time_budget: Optional[float] = None  # seconds allowed on the full input, optimizes slower solutions
+    weave_project: Optional[str] = None  # log traces to this weave project
+    profile: bool = False  # print per-stage latency, token and cache metrics at the end
+    metrics_path: Optional[Path] = None  # export metrics, Prometheus text for .prom and JSON otherwise
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    if args.weave_project:
+        weave.init(args.weave_project)
+    run_log = RunLog(args.run_dir)
+    asyncio.run(
+        run_batch(
+            find_problems(args.problems_folder),
+            Retriever(),
+            run_log,
+            max_workers=args.max_workers,
+            model=args.model,
+            temperature=args.temperature,
+            max_iterations=args.max_iterations,
+            code_execution_timeout=args.timeout,
+            speculative=args.speculative,
+            time_budget=args.time_budget,
+        )
+    )
+    solved = sum(record["status"] == "passed" for record in run_log.results.values())
+    logger.info(f"Solved {solved} of {len(run_log.results)} problems, results in {run_log.results_path}")
+    if args.profile:
+        metrics.log_summary()
+    if args.metrics_path:
+        metrics.export(args.metrics_path)
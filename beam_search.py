@@ -0,0 +1,218 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, List
+
+from agent import draft_solution, improve_solution, reflection
+from tracing import traced_op
+from utils import FAST_LLM, STRONG_LLM, Problem, Solution, TestReport, check_correctness
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Candidate:
+    solution: Solution
+    test_report: TestReport
+    depth: int = 0
+
+    @property
+    def passed(self) -> bool:
+        return self.test_report.status == "passed"
+
+    @property
+    def score(self) -> tuple:
+        # passing first, then more matching cases, then the faster program
+        runtime = self.test_report.runtime
+        return (
+            self.passed,
+            self.test_report.partial_credit,
+            -(runtime if runtime is not None else float("inf")),
+        )
+
+
+class BeamSearch:
+    """
+    Beam search over candidate solutions. Each round keeps the `beam_width` best candidates by
+    partial test credit and runtime, and expands every survivor into `num_children` improved
+    solutions concurrently. Stops as soon as a candidate passes or the budget runs out.
+    """
+
+    def __init__(
+        self,
+        beam_width: int = 3,
+        num_children: int = 2,
+        max_rounds: int = 3,
+        max_candidates: int = 30,
+        llm_concurrency: int = 4,
+        sandbox_concurrency: int = 4,
+        draft_model: str = FAST_LLM,
+        model: str = STRONG_LLM,
+        temperature: float = 0.7,
+        timeout: int = 10,
+    ):
+        self.beam_width = beam_width
+        self.num_children = num_children
+        self.max_rounds = max_rounds
+        self.max_candidates = max_candidates
+        self.draft_model = draft_model
+        self.model = model
+        self.temperature = temperature
+        self.timeout = timeout
+        self.llm_semaphore = asyncio.Semaphore(llm_concurrency)
+        self.sandbox_semaphore = asyncio.Semaphore(sandbox_concurrency)
+        self.num_candidates = 0
+
+    async def evaluate(self, problem: Problem, solution: Solution, depth: int) -> Candidate:
+        async with self.sandbox_semaphore:
+            test_report = await check_correctness(
+                solution.source_code, problem.sample_input, problem.sample_output, self.timeout
+            )
+        return Candidate(solution=solution, test_report=test_report, depth=depth)
+
+    async def draft(self, problem: Problem) -> Candidate:
+        async with self.llm_semaphore:
+            solution = await draft_solution(
+                problem=problem, model=self.draft_model, temperature=self.temperature
+            )
+        return await self.evaluate(problem, solution, depth=0)
+
+    async def reflect(self, problem: Problem, parent: Candidate):
+        async with self.llm_semaphore:
+            return await reflection(
+                problem=problem,
+                incorrect_solution=parent.solution,
+                test_report=parent.test_report.as_xml,
+                model=self.model,
+                temperature=self.temperature,
+            )
+
+    async def child(self, problem: Problem, parent: Candidate, reflections: Awaitable) -> Candidate:
+        """Samples one improvement of `parent` from its (shared) reflection."""
+        reflections = await reflections
+        async with self.llm_semaphore:
+            solution = await improve_solution(
+                problem=problem,
+                incorrect_solution=parent.solution,
+                test_report=parent.test_report.as_xml,
+                reflections=reflections,
+                model=self.model,
+                temperature=self.temperature,
+            )
+        return await self.evaluate(problem, solution, depth=parent.depth + 1)
+
+    def budget(self, requested: int) -> int:
+        granted = max(min(requested, self.max_candidates - self.num_candidates), 0)
+        self.num_candidates += granted
+        return granted
+
+    async def search(self, problem: Problem) -> Candidate:
+        self.num_candidates = 0
+        beam = await until_passed([self.draft(problem) for _ in range(self.budget(self.beam_width))])
+        if not beam:
+            raise RuntimeError(
+                f"Beam search got no candidate for {problem.problem_name}: every draft failed "
+                f"or the budget ({self.beam_width} wide, {self.max_candidates} candidates) is empty"
+            )
+        beam = sorted(beam, key=lambda c: c.score, reverse=True)
+        for round_index in range(self.max_rounds):
+            logger.info(
+                f"Beam round {round_index}: scores {[round_score(c) for c in beam]}, "
+                f"{self.num_candidates}/{self.max_candidates} candidates used"
+            )
+            if beam[0].passed:
+                break
+            num_children = [self.budget(self.num_children) for _ in beam]
+            if not any(num_children):
+                break
+            # each parent is reflected on once and its children sample improvements from it
+            reflections = [
+                (parent, asyncio.ensure_future(self.reflect(problem, parent)), n)
+                for parent, n in zip(beam, num_children)
+                if n
+            ]
+            try:
+                children = await until_passed(
+                    [
+                        self.child(problem, parent, parent_reflections)
+                        for parent, parent_reflections, n in reflections
+                        for _ in range(n)
+                    ]
+                )
+            finally:
+                await cancel_all([parent_reflections for _, parent_reflections, _ in reflections])
+            beam = sorted(beam + children, key=lambda c: c.score, reverse=True)[: self.beam_width]
+        return beam[0]
+
+
+async def cancel_all(tasks: List[asyncio.Future]):
+    """Cancels the tasks and waits for them, so their subprocesses and requests are cleaned up."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def until_passed(candidates: List[Awaitable[Candidate]]) -> List[Candidate]:
+    """
+    Runs the candidates concurrently and returns them as they finish, cancelling the rest as soon
+    as one passes. A candidate that raises is logged and dropped.
+    """
+    tasks = [asyncio.ensure_future(candidate) for candidate in candidates]
+    finished = []
+    try:
+        for future in asyncio.as_completed(tasks):
+            try:
+                candidate = await future
+            except Exception as e:
+                logger.error(f"Dropping a candidate that failed: {e!r}")
+                continue
+            finished.append(candidate)
+            if candidate.passed:
+                break
+    finally:
+        await cancel_all(tasks)
+    return finished
+
+
+def round_score(candidate: Candidate) -> str:
+    return f"{candidate.test_report.passed_cases}/{candidate.test_report.total_cases}"
+
+
+@traced_op
+async def beam_search_solver(
+    problem: Problem,
+    beam_width: int = 3,
+    num_children: int = 2,
+    max_rounds: int = 3,
+    max_candidates: int = 30,
+    llm_concurrency: int = 4,
+    sandbox_concurrency: int = 4,
+    model: str = STRONG_LLM,
+    temperature: float = 0.7,
+    timeout: int = 10,
+) -> dict:
+    search = BeamSearch(
+        beam_width=beam_width,
+        num_children=num_children,
+        max_rounds=max_rounds,
+        max_candidates=max_candidates,
+        llm_concurrency=llm_concurrency,
+        sandbox_concurrency=sandbox_concurrency,
+        model=model,
+        temperature=temperature,
+        timeout=timeout,
+    )
+    best = await search.search(problem)
+    logger.info(
+        f"Beam search finished for problem {problem.problem_name}: {best.test_report.status} "
+        f"({round_score(best)} cases) after {search.num_candidates} candidates"
+    )
+    return {
+        "solution": best.solution,
+        "stage": "beam" if best.passed else "failed",
+        "test_report": best.test_report,
+    }
@@ -0,0 +1,87 @@
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import simple_parsing
+
+from benchmarks.normalization import load_snippets
+from utils import (
+    clean_code_string,
+    clean_code_strings,
+    language,
+    remove_extra_newlines,
+    tree_parser,
+)
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_remove_comments_and_docstrings(code: str) -> str:
+    """The per-call query compilation `remove_comments_and_docstrings` replaced."""
+    doc_str_pattern = """
+    (module . (expression_statement (string)) @module_doc_str)
+    (class_definition body: (block . (expression_statement (string)) @class_doc_str))
+    (function_definition body: (block . (expression_statement (string)) @function_doc_str))
+    """
+    comment_pattern = "(comment) @comment"
+    root_node = tree_parser.parse(code.encode()).root_node
+    doc_strs = language.query(doc_str_pattern).captures(root_node)
+    comments = language.query(comment_pattern).captures(root_node)
+    remove_points = set((node.start_byte, node.end_byte) for node, _ in doc_strs)
+    remove_points |= set((node.start_byte, node.end_byte) for node, _ in comments)
+
+    cleaned_code = []
+    last_index = 0
+    for start, end in sorted(remove_points):
+        if last_index < start:
+            cleaned_code.append(code[last_index:start])
+        last_index = end
+    cleaned_code.append(code[last_index:])
+    return "".join(cleaned_code)
+
+
+def legacy_clean_code_string(code: str) -> str:
+    return remove_extra_newlines(legacy_remove_comments_and_docstrings(code))
+
+
+def timed(fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+@dataclass
+class ScriptArgs:
+    """Compare comment and docstring stripping throughput against the previous implementation. Example usage:
+    python -m benchmarks.comment_stripping --corpus data/cache/raw.jsonl --limit 50000
+    """
+    corpus: Optional[Path] = None  # JSONL with a `code` column, e.g. the raw CodeContests dump
+    limit: int = 20000  # number of snippets to clean
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    snippets = load_snippets(args.corpus, args.limit)
+    logger.info(f"Benchmarking comment stripping on {len(snippets)} snippets")
+
+    legacy, legacy_time = timed(
+        lambda codes: [legacy_clean_code_string(code) for code in codes], snippets
+    )
+    single, single_time = timed(
+        lambda codes: [clean_code_string(code) for code in codes], snippets
+    )
+    batch, batch_time = timed(clean_code_strings, snippets)
+    assert legacy == single == batch, "cleaned code differs from the reference"
+
+    for name, elapsed in [
+        ("per-call queries", legacy_time),
+        ("precompiled queries", single_time),
+        ("precompiled queries, batched pool", batch_time),
+    ]:
+        logger.info(f"{name}: {len(snippets) / elapsed:,.0f} snippets/s")
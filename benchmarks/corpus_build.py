@@ -0,0 +1,96 @@
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import simple_parsing
+from datasets import load_dataset
+
+from benchmarks.pipeline import RSSSampler
+from retriever import (
+    CORPUS_SHARD_SIZE,
+    CORPUS_WORKERS,
+    build_code_contests_corpus,
+    clean_code,
+    clean_description,
+    get_solution,
+    get_test_cases,
+)
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_get_code_contests_data(cache_file: Path, limit: Optional[int] = None):
+    """
+    The six-pass `map`/`filter` build `build_code_contests_corpus` replaced. Arrow cache reuse is
+    disabled so repeated runs time the work and not a cache hit.
+    """
+    ds = load_dataset("deepmind/code_contests")
+    train_ds = ds["train"] if limit is None else ds["train"].select(range(limit))
+
+    uncached = {"num_proc": 4, "load_from_cache_file": False}
+    train_ds = train_ds.map(get_solution, **uncached)
+    train_ds = train_ds.filter(lambda x: not x["is_description_translated"], **uncached)
+    train_ds = train_ds.filter(lambda x: len(x["code"]) > 0, **uncached)
+    train_ds = train_ds.map(clean_code, **uncached)
+    train_ds = train_ds.map(clean_description, **uncached)
+    train_ds = train_ds.map(get_test_cases, **uncached)
+    train_ds = train_ds.remove_columns(
+        [
+            col
+            for col in train_ds.column_names
+            if col not in ["description", "code", "sample_inputs", "sample_outputs"]
+        ]
+    )
+
+    train_df = train_ds.to_pandas()
+    train_df = train_df.explode("code").reset_index(drop=True)
+    train_df = train_df.drop_duplicates(subset=["code"], keep="first")
+    train_df.to_json(cache_file, orient="records", lines=True)
+    return train_df
+
+
+@dataclass
+class ScriptArgs:
+    """Compare build time and peak memory of the fused streaming corpus build against the multi-pass one. Example usage:
+    python -m benchmarks.corpus_build --limit 2000 --num_workers 4
+    """
+    output_dir: Path = Path("data/benchmarks/corpus_build")  # where both builds write their JSONL
+    limit: Optional[int] = None  # CodeContests train rows to build from, None for all
+    shard_size: int = CORPUS_SHARD_SIZE  # rows per shard of the streaming build
+    num_workers: int = CORPUS_WORKERS  # processes of the streaming build
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    with RSSSampler(include_children=True) as legacy_rss:
+        start = time.perf_counter()
+        legacy_get_code_contests_data(args.output_dir / "legacy.jsonl", args.limit)
+        legacy_time = time.perf_counter() - start
+
+    with RSSSampler(include_children=True) as fused_rss:
+        start = time.perf_counter()
+        build_code_contests_corpus(
+            args.output_dir / "fused.jsonl", args.shard_size, args.num_workers, args.limit
+        )
+        fused_time = time.perf_counter() - start
+
+    legacy = pd.read_json(args.output_dir / "legacy.jsonl", lines=True)
+    fused = pd.read_json(args.output_dir / "fused.jsonl", lines=True)
+    assert legacy["code"].tolist() == fused["code"].tolist(), "the builds produced different corpora"
+
+    for name, elapsed, rss in [
+        ("multi-pass map/filter", legacy_time, legacy_rss),
+        ("fused streaming", fused_time, fused_rss),
+    ]:
+        logger.info(
+            f"{name}: {len(fused)} solutions in {elapsed:.1f}s, peak RSS {rss.peak / 1024**2:,.0f} MB"
+        )
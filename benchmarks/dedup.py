@@ -0,0 +1,61 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import bm25s
+import numpy as np
+import pandas as pd
+import simple_parsing
+
+from dedup import cluster_solutions, deduplicate_solutions
+from retriever import build_bm25_index
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def retrieval_diversity(
+    corpus: pd.DataFrame, labels: np.ndarray, queries: list, k: int
+) -> float:
+    """Mean fraction of distinct near-duplicate clusters among the top-k BM25 results."""
+    index = build_bm25_index(corpus["normalized_code"].tolist(), show_progress=False)
+    query_tokens = bm25s.tokenize(queries, stopwords=None, show_progress=False)
+    indices, _ = index.retrieve(query_tokens, k=k, show_progress=False)
+    return float(np.mean([len(set(labels[row])) / k for row in indices]))
+
+
+@dataclass
+class ScriptArgs:
+    """Report corpus-size reduction and retrieval diversity of near-duplicate removal. Example usage:
+    python -m benchmarks.dedup --input data/cache/preprocessed.jsonl --threshold 0.85
+    """
+    input: Path = Path("data/cache/preprocessed.jsonl")  # corpus with a `normalized_code` column
+    threshold: float = 0.85  # estimated Jaccard similarity above which solutions are duplicates
+    max_per_problem: int = 10  # representatives kept per problem
+    num_queries: int = 500  # corpus solutions used as retrieval queries
+    k: int = 50  # retrieval depth, matching the agent's top_k
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    data_df = pd.read_json(args.input, lines=True).reset_index(drop=True)
+    labels = cluster_solutions(data_df, args.threshold)
+    data_df["cluster"] = labels
+    deduped_df = deduplicate_solutions(data_df, args.threshold, args.max_per_problem)
+
+    rng = np.random.default_rng(0)
+    queries = data_df["normalized_code"].iloc[
+        rng.choice(len(data_df), min(args.num_queries, len(data_df)), replace=False)
+    ].tolist()
+    before = retrieval_diversity(data_df, labels, queries, args.k)
+    after = retrieval_diversity(
+        deduped_df, deduped_df["cluster"].to_numpy(), queries, args.k
+    )
+    logger.info(
+        f"Corpus size: {len(data_df)} -> {len(deduped_df)} "
+        f"({1 - len(deduped_df) / len(data_df):.1%} reduction)"
+    )
+    logger.info(f"Distinct clusters in top-{args.k}: {before:.1%} -> {after:.1%}")
@@ -0,0 +1,94 @@
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+import simple_parsing
+from joblib import Parallel, delayed
+
+import retriever
+from retriever import normalize_code, normalize_code_list, tokenize_node
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_normalize_code(code: str) -> Optional[str]:
+    """The recursive generator tokenizer `normalize_code` replaced."""
+    try:
+        tree = retriever.ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    return " ".join(tokenize_node(tree))
+
+
+def legacy_normalize_code_list(code_list: List[str]) -> List[Optional[str]]:
+    """The one-task-per-snippet dispatch `normalize_code_list` replaced."""
+    if len(code_list) > 1000:
+        return Parallel(n_jobs=-1)(
+            delayed(legacy_normalize_code)(code) for code in code_list
+        )
+    return [legacy_normalize_code(code) for code in code_list]
+
+
+def load_snippets(corpus: Optional[Path], limit: int) -> List[str]:
+    """
+    Up to `limit` distinct snippets, so `normalize_code_list` can't answer any of them from its
+    cache and the timings measure the tokenizer and the process pool.
+    """
+    if corpus is not None:
+        return pd.read_json(corpus, lines=True, nrows=limit)["code"].drop_duplicates().tolist()
+    # fall back to the repo's own sources when no corpus dump is available, each copy made
+    # distinct by a trailing comment that doesn't change its normalization
+    sources = [path.read_text() for path in Path(".").glob("*.py")]
+    return [f"{sources[i % len(sources)]}\n# copy {i}\n" for i in range(limit)]
+
+
+def timed(fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+@dataclass
+class ScriptArgs:
+    """Compare AST normalization throughput against the previous implementation. Example usage:
+    python -m benchmarks.normalization --corpus data/cache/raw.jsonl --limit 50000
+    """
+    corpus: Optional[Path] = None  # JSONL with a `code` column, e.g. the raw CodeContests dump
+    limit: int = 20000  # number of snippets to normalize
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    snippets = load_snippets(args.corpus, args.limit)
+    logger.info(f"Benchmarking normalization on {len(snippets)} snippets")
+
+    legacy_single, legacy_single_time = timed(
+        lambda codes: [legacy_normalize_code(code) for code in codes], snippets
+    )
+    single, single_time = timed(
+        lambda codes: [normalize_code(code) for code in codes], snippets
+    )
+    assert single == legacy_single, "iterative tokenizer output differs from the reference"
+
+    legacy_pool, legacy_pool_time = timed(legacy_normalize_code_list, snippets)
+    retriever._normalize_cache.clear()
+    pool, pool_time = timed(normalize_code_list, snippets)
+    # the same snippets again are all cache hits
+    _, cached_time = timed(normalize_code_list, snippets)
+    assert pool == legacy_pool, "chunked normalization output differs from the reference"
+
+    for name, elapsed in [
+        ("recursive tokenizer, single process", legacy_single_time),
+        ("iterative tokenizer, single process", single_time),
+        ("recursive tokenizer, per-snippet tasks", legacy_pool_time),
+        ("iterative tokenizer, chunked tasks", pool_time),
+        ("iterative tokenizer, cached", cached_time),
+    ]:
+        logger.info(f"{name}: {len(snippets) / elapsed:,.0f} snippets/s")
@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import resource
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import psutil
+import simple_parsing
+from aiohttp import web
+
+from llm_server import LatencyModel
+from metrics import metrics
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_OUTPUT_PATTERNS = [
+    re.compile(r"<sample_output>\n(.*?)\n</sample_output>", re.DOTALL),
+    re.compile(r"(?:Expected )?Output: \n(.*?)\n(?:\n|$)", re.DOTALL),
+]
+
+
+def fill_schema(schema: dict, document: str) -> dict:
+    """A JSON object matching a flat instructor schema, taking `source_code` from the document."""
+    values = {}
+    for name, field in schema.get("properties", {}).items():
+        if name == "source_code":
+            match = re.search(r"<source_code>\n?(.*?)</source_code>", document, re.DOTALL)
+            values[name] = match.group(1).strip() if match else "print()"
+        elif field.get("type") == "array":
+            values[name] = [f"{name} item"]
+        else:
+            values[name] = f"{name} text"
+    return values
+
+
+class MockLLM:
+    """
+    Deterministic synthetic chat completions for benchmarking orchestration offline. Free-form
+    answers carry a program that prints the sample output (so it passes) for a `pass_rate`
+    fraction of requests, chosen by request hash, and instructor extraction requests get a JSON
+    object for the requested schema. Every call's interval and token counts are recorded.
+    """
+
+    def __init__(self, latency: LatencyModel, pass_rate: float = 0.5, completion_tokens: int = 400):
+        self.latency = latency
+        self.pass_rate = pass_rate
+        self.completion_tokens = completion_tokens
+        self.calls: List[Tuple[float, float, int, int]] = []
+
+    def respond(self, messages: List[dict]) -> str:
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        prompt = "\n".join(str(m["content"]) for m in messages)
+        if "json_schema" in system:
+            start = system.index("{", system.index("json_schema"))
+            schema, _ = json.JSONDecoder().raw_decode(system[start:])
+            return json.dumps(fill_schema(schema, messages[-1]["content"]))
+
+        digest = hashlib.sha256(prompt.encode()).digest()
+        passes = digest[0] / 255 < self.pass_rate
+        sample_output = next(
+            (m.group(1) for p in SAMPLE_OUTPUT_PATTERNS if (m := p.search(prompt))), ""
+        )
+        program = f"print({sample_output.strip()!r})" if passes else "print('Case #1: 0')"
+        reasoning = " ".join(["step"] * self.completion_tokens)
+        return f"<root>\n<algorithm>\n{reasoning}\n</algorithm>\n<source_code>\n{program}\n</source_code>\n</root>"
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        from utils import count_tokens
+
+        start = time.perf_counter()
+        body = await request.json()
+        content = self.respond(body["messages"])
+        prompt_tokens = sum(count_tokens(str(m["content"])) for m in body["messages"])
+        completion_tokens = count_tokens(content)
+        await asyncio.sleep(self.latency.delay(completion_tokens))
+        self.calls.append((start, time.perf_counter(), prompt_tokens, completion_tokens))
+        return web.json_response(
+            {
+                "id": f"mock-{len(self.calls)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+
+class RSSSampler:
+    """Peak resident memory of this process, and optionally its children, sampled in a background thread."""
+
+    def __init__(self, interval: float = 0.05, include_children: bool = False):
+        self.interval = interval
+        self.include_children = include_children
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        process = psutil.Process()
+        while not self._stop.is_set():
+            processes = [process]
+            if self.include_children:
+                processes += process.children(recursive=True)
+            rss = 0
+            for p in processes:
+                try:
+                    rss += p.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def union_length(intervals: List[Tuple[float, float]]) -> float:
+    total, end = 0.0, float("-inf")
+    for start, stop in sorted(intervals):
+        if stop > end:
+            total += stop - max(start, end)
+            end = stop
+    return total
+
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def instrument_sandbox() -> List[Tuple[float, float]]:
+    """Records the interval of every sandboxed program run by `check_correctness`."""
+    import utils
+
+    intervals = []
+    exec_program = utils.exec_program
+
+    async def timed_exec_program(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await exec_program(*args, **kwargs)
+        finally:
+            intervals.append((start, time.perf_counter()))
+
+    utils.exec_program = timed_exec_program
+    return intervals
+
+
+async def benchmark_solver(
+    name: str, args: "ScriptArgs", mock: MockLLM, sandbox: List[Tuple[float, float]]
+) -> dict:
+    from evaluation import load_solver
+    from utils import find_problems
+
+    try:
+        solver = load_solver(name, args.timeout, args.retriever_path)
+    except Exception as e:
+        logger.warning(f"Skipping {name}: {e!r}")
+        return {"skipped": repr(e)}
+
+    problems = []
+    for problem in sorted(find_problems(args.problems_folder), key=lambda p: p.problem_name):
+        first_call, first_run = len(mock.calls), len(sandbox)
+        cpu_before = children_cpu_seconds()
+        start = time.perf_counter()
+        status, error = None, None
+        with RSSSampler() as rss:
+            try:
+                result = await solver(problem)
+                status = result["test_report"].status
+            except Exception as e:
+                error = repr(e)
+        wall_time = time.perf_counter() - start
+
+        calls = mock.calls[first_call:]
+        llm_intervals = [(call_start, call_end) for call_start, call_end, _, _ in calls]
+        sandbox_intervals = sandbox[first_run:]
+        problems.append(
+            {
+                "problem": problem.problem_name,
+                "status": status,
+                "error": error,
+                "wall_time": wall_time,
+                # time with at least one call in flight, i.e. the LLM share of the critical path
+                "critical_path": {
+                    "llm": union_length(llm_intervals),
+                    "sandbox": union_length(sandbox_intervals),
+                    "other": wall_time - union_length(llm_intervals + sandbox_intervals),
+                },
+                "llm_calls": len(calls),
+                "prompt_tokens": sum(call[2] for call in calls),
+                "completion_tokens": sum(call[3] for call in calls),
+                "sandbox_runs": len(sandbox_intervals),
+                "sandbox_cpu_seconds": children_cpu_seconds() - cpu_before,
+                "peak_rss_mb": rss.peak / 1024**2,
+            }
+        )
+        logger.info(
+            f"{name} / {problem.problem_name}: {status or error} in {wall_time:.2f}s, "
+            f"{len(calls)} LLM calls, {problems[-1]['sandbox_cpu_seconds']:.2f} sandbox CPU s"
+        )
+    return {
+        "problems": problems,
+        "total_wall_time": sum(p["wall_time"] for p in problems),
+        "total_llm_calls": sum(p["llm_calls"] for p in problems),
+        "total_tokens": sum(p["prompt_tokens"] + p["completion_tokens"] for p in problems),
+        "solved": sum(p["status"] == "passed" for p in problems),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+@dataclass
+class ScriptArgs:
+    """Benchmark the solver pipelines end to end against a local mocked LLM backend. Example usage:
+    python -m benchmarks.pipeline --solvers zero_shot,rag_reflection --latency lognormal:1.0,0.3 --tokens_per_second 80
+    """
+    solvers: Optional[str] = None  # comma separated subset of evaluation.SOLVERS, all by default
+    problems_folder: Path = Path("2024/practice")  # problems to solve
+    output: Path = Path("data/benchmarks/pipeline.json")  # machine-readable results
+    port: int = 8011  # port of the mocked backend
+    latency: str = "fixed:0.2"  # time to first token of mocked calls, see llm_server.LatencyModel
+    tokens_per_second: float = 200.0  # generation speed of mocked calls
+    completion_tokens: int = 400  # approximate length of free-form mocked answers
+    pass_rate: float = 0.5  # fraction of mocked solutions that pass the samples
+    timeout: int = 10  # code execution timeout in seconds
+    retriever_path: str = "param-bharat/rag-hackercup"  # corpus for the RAG pipeline
+    seed: int = 0  # seed of the mocked latency draws
+
+
+async def main(args: ScriptArgs) -> dict:
+    mock = MockLLM(
+        LatencyModel(args.latency, args.tokens_per_second, args.seed),
+        pass_rate=args.pass_rate,
+        completion_tokens=args.completion_tokens,
+    )
+    runner = web.AppRunner(mock.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    sandbox = instrument_sandbox()
+    try:
+        results = {}
+        # evaluation reads the backend URL on import, so it is imported once that is set
+        from evaluation import SOLVERS
+
+        for name in args.solvers.split(",") if args.solvers else SOLVERS:
+            metrics.reset()
+            results[name] = await benchmark_solver(name, args, mock, sandbox)
+            results[name]["metrics"] = metrics.to_json()
+    finally:
+        await runner.cleanup()
+    return results
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    # the API client reads these when `utils` is first imported
+    os.environ["BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("API_KEY", "dummy_key")
+    os.environ.setdefault("OPENAI_API_KEY", "dummy_key")
+
+    results = asyncio.run(main(args))
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": {key: str(value) for key, value in vars(args).items()},
+        "solvers": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    for name, result in results.items():
+        if "skipped" in result:
+            logger.info(f"{name}: skipped")
+            continue
+        logger.info(
+            f"{name}: {result['solved']}/{len(result['problems'])} solved, "
+            f"{result['total_wall_time']:.1f}s, {result['total_llm_calls']} LLM calls, "
+            f"{result['total_tokens']:,} tokens"
+        )
+    logger.info(f"Results written to {args.output}")
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import simple_parsing
+import weave
+from weave.trace.client_context import weave_client as weave_client_context
+from weave.trace.weave_client import WeaveClient
+from weave.trace_server.sqlite_trace_server import SqliteTraceServer
+
+import tracing
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+
+def helper(code_list: list) -> list:
+    return [code.strip() for code in code_list]
+
+
+async def stage(query: str) -> str:
+    return query
+
+
+def legacy_raise_in_weave(raise_error: bool = False, msg: str = ""):
+    """The exception-based error annotation `annotate_error` replaced."""
+    try:
+        if raise_error:
+            raise Exception(msg)
+    except Exception:
+        pass
+
+
+def local_client(path: Path) -> WeaveClient:
+    """A weave client writing to a local SQLite trace server, so traced calls do real work offline."""
+    server = SqliteTraceServer(str(path))
+    server.setup_tables()
+    return WeaveClient("benchmark", "tracing", server, ensure_project_exists=False)
+
+
+def per_call_us(fn, *args, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(*args)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def per_async_call_us(fn, *args, calls: int) -> float:
+    async def run():
+        start = time.perf_counter()
+        for _ in range(calls):
+            await fn(*args)
+        return (time.perf_counter() - start) / calls * 1e6
+
+    return asyncio.run(run())
+
+
+@dataclass
+class ScriptArgs:
+    """Measure the per-call overhead of traced ops at each tracing level. Example usage:
+    python -m benchmarks.tracing --calls 100000 --traced_calls 500
+    """
+    calls: int = 100000  # calls per measurement without a weave client
+    traced_calls: int = 500  # calls per measurement with a local weave client
+    payload_chars: int = 800000  # size of the string passed to the stage, like a full input file
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    os.environ["WEAVE_PRINT_CALL_LINK"] = "false"
+    code_list = ["  print(1)  "] * 5
+    payload = "5 " * (args.payload_chars // 2)
+
+    logger.info(
+        f"undecorated: helper {per_call_us(helper, code_list, calls=args.calls):.2f}us, "
+        f"stage {per_async_call_us(stage, payload, calls=args.calls):.2f}us"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        client = local_client(Path(tmp) / "traces.db")
+        for level in tracing.TRACING_LEVELS:
+            # levels are read when functions are decorated, i.e. at import time
+            tracing.TRACE_LEVEL = level
+            traced_helper = tracing.traced_op(helper, level="full")
+            traced_stage = tracing.traced_op(stage, level="stages")
+
+            weave_client_context.set_weave_client_global(None)
+            untraced = (
+                per_call_us(traced_helper, code_list, calls=args.calls),
+                per_async_call_us(traced_stage, payload, calls=args.calls),
+            )
+            weave_client_context.set_weave_client_global(client)
+            traced = (
+                per_call_us(traced_helper, code_list, calls=args.traced_calls),
+                per_async_call_us(traced_stage, payload, calls=args.traced_calls),
+            )
+            logger.info(
+                f"TRACE_LEVEL={level}: helper {untraced[0]:.2f}us without a client, "
+                f"{traced[0]:.1f}us traced; stage {untraced[1]:.2f}us without a client, "
+                f"{traced[1]:.1f}us traced"
+            )
+
+        tracing.TRACE_LEVEL = "stages"
+        legacy = weave.op(legacy_raise_in_weave)
+        logger.info(
+            f"error annotation, traced: raise_in_weave "
+            f"{per_call_us(legacy, True, 'error', calls=args.traced_calls):.0f}us, "
+            f"annotate_error {per_call_us(tracing.annotate_error, 'error', calls=args.traced_calls):.0f}us"
+        )
+        weave_client_context.set_weave_client_global(None)
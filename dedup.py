@@ -0,0 +1,148 @@
+import logging
+import zlib
+from collections import defaultdict
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingle_hashes(text: str, shingle_size: int = 5) -> np.ndarray:
+    """32-bit hashes of the token n-grams of a normalized code string."""
+    tokens = text.split()
+    if len(tokens) < shingle_size:
+        shingles = {" ".join(tokens)} if tokens else set()
+    else:
+        shingles = {
+            " ".join(tokens[i : i + shingle_size])
+            for i in range(len(tokens) - shingle_size + 1)
+        }
+    return np.array([zlib.crc32(s.encode()) for s in shingles], dtype=np.uint64)
+
+
+class MinHasher:
+    """MinHash signatures over token shingles, with universal hashing as the permutations."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text, self.shingle_size)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # uint64 products wrap around, which is fine for hashing
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        return np.stack([self.signature(text) for text in texts])
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Bands and rows per band whose S-curve threshold (1/b)^(1/r) is closest to `threshold`."""
+    candidates = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(candidates, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+def compute_signatures(
+    texts: List[str], hasher: MinHasher, chunk_size: int = 2000
+) -> np.ndarray:
+    if len(texts) <= chunk_size:
+        return hasher.signatures(texts)
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    return np.concatenate(
+        Parallel(n_jobs=-1)(delayed(hasher.signatures)(chunk) for chunk in chunks)
+    )
+
+
+def cluster_signatures(
+    signatures: np.ndarray, threshold: float, bands: int, rows: int
+) -> np.ndarray:
+    """
+    Groups near-duplicates with LSH banding, confirming each candidate pair by its estimated
+    Jaccard similarity. Returns a cluster label (the smallest member index) per signature.
+    """
+    parents = np.arange(len(signatures))
+
+    def find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for band in range(bands):
+        buckets = defaultdict(list)
+        band_signatures = np.ascontiguousarray(signatures[:, band * rows : (band + 1) * rows])
+        for i, band_signature in enumerate(band_signatures):
+            buckets[band_signature.tobytes()].append(i)
+        for members in buckets.values():
+            for other in members[1:]:
+                first, root = find(members[0]), find(other)
+                if first == root:
+                    continue
+                if np.mean(signatures[members[0]] == signatures[other]) >= threshold:
+                    parents[max(first, root)] = min(first, root)
+    return np.array([find(i) for i in range(len(signatures))])
+
+
+def cluster_solutions(
+    data_df: pd.DataFrame,
+    threshold: float = 0.85,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+    text_column: str = "normalized_code",
+    group_column: str = "description",
+) -> np.ndarray:
+    """Near-duplicate cluster labels for the rows of `data_df`, only ever clustering within a problem."""
+    hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+    bands, rows = lsh_params(num_perm, threshold)
+    signatures = compute_signatures(data_df[text_column].tolist(), hasher)
+
+    labels = np.arange(len(data_df))
+    for positions in data_df.groupby(group_column, sort=False).indices.values():
+        if len(positions) > 1:
+            labels[positions] = positions[
+                cluster_signatures(signatures[positions], threshold, bands, rows)
+            ]
+    return labels
+
+
+def deduplicate_solutions(
+    data_df: pd.DataFrame,
+    threshold: float = 0.85,
+    max_per_problem: int = 10,
+    num_perm: int = 128,
+    group_column: str = "description",
+) -> pd.DataFrame:
+    """
+    Drops near-duplicate solutions: keeps one representative per MinHash/LSH cluster and at
+    most `max_per_problem` representatives per problem, preferring the largest clusters.
+    """
+    data_df = data_df.reset_index(drop=True)
+    labels = cluster_solutions(data_df, threshold, num_perm, group_column=group_column)
+    cluster_sizes = pd.Series(labels).value_counts()
+
+    keep = []
+    for positions in data_df.groupby(group_column, sort=False).indices.values():
+        representatives = sorted(
+            set(labels[positions]), key=lambda label: (-cluster_sizes[label], label)
+        )
+        keep.extend(representatives[:max_per_problem])
+
+    deduped_df = data_df.iloc[sorted(keep)].reset_index(drop=True)
+    logger.info(
+        f"Near-duplicate removal kept {len(deduped_df)} of {len(data_df)} solutions "
+        f"({1 - len(deduped_df) / max(len(data_df), 1):.1%} reduction, "
+        f"{cluster_sizes.size} clusters)"
+    )
+    return deduped_df
@@ -0,0 +1,145 @@
+import logging
+import multiprocessing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Sequence
+
+import psutil
+import pyarrow as pa
+import simple_parsing
+from datasets import Dataset, load_dataset
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+DOC_COLUMNS = [
+    "description",
+    "code",
+    "sample_inputs",
+    "sample_outputs",
+    "normalized_code",
+]
+
+
+def dedupe_column(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Dictionary-encodes a string column so each unique value is stored once across all chunks."""
+    return column.dictionary_encode().unify_dictionaries()
+
+
+class DocStore:
+    """
+    Columnar store of the retrieval corpus backed by (memory-mapped) Arrow buffers.
+    Descriptions are deduplicated, and rows only become Python dicts when they are taken.
+    """
+
+    def __init__(self, table: pa.Table, id_offset: int = 0):
+        self.table = table
+        # doc ids of this store start at `id_offset`, so several stores can share one id space
+        self.id_offset = id_offset
+
+    @classmethod
+    def from_table(cls, table: pa.Table, id_offset: int = 0) -> "DocStore":
+        table = table.select([col for col in DOC_COLUMNS if col in table.column_names])
+        index = table.schema.get_field_index("description")
+        if not pa.types.is_dictionary(table.schema.field(index).type):
+            table = table.set_column(
+                index, "description", dedupe_column(table.column(index))
+            )
+        return cls(table, id_offset)
+
+    @classmethod
+    def from_dataset(cls, ds: Dataset) -> "DocStore":
+        # `datasets` keeps its arrow cache memory-mapped, so only the descriptions are copied
+        return cls.from_table(ds.data.table)
+
+    @classmethod
+    def load(cls, path: Path) -> "DocStore":
+        logger.info(f"Loading doc store from {path}")
+        source = pa.memory_map(str(path), "r")
+        return cls(pa.ipc.open_file(source).read_all())
+
+    def save(self, path: Path):
+        logger.info(f"Saving doc store to {path}")
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, self.table.schema) as writer:
+                writer.write_table(self.table)
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, index: int) -> dict:
+        return self.take([index])[0]
+
+    def column(self, name: str) -> List:
+        return self.table.column(name).to_pylist()
+
+    def take(self, indices: Sequence[int]) -> List[dict]:
+        """Materializes only the requested rows (local indices) as Python dicts."""
+        rows = self.table.take(pa.array(indices, type=pa.int64())).to_pylist()
+        for index, row in zip(indices, rows):
+            row["doc_id"] = self.id_offset + int(index)
+        return rows
+
+    def iter_batches(self, batch_size: int = 1024) -> Iterator[List[dict]]:
+        for start in range(0, len(self), batch_size):
+            yield self.take(list(range(start, min(start + batch_size, len(self)))))
+
+    @property
+    def num_descriptions(self) -> int:
+        # chunks of a unified column share one dictionary, so count it once
+        column = self.table["description"].unify_dictionaries()
+        return len(column.chunk(0).dictionary) if column.num_chunks else 0
+
+
+def current_rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 1024**2
+
+
+def _measure_records(path: str, results: dict):
+    ds = load_dataset(path, split="train")
+    baseline = current_rss_mb()
+    data_df = ds.to_pandas()
+    docs = data_df.to_dict(orient="records")
+    results["records"] = current_rss_mb() - baseline
+    results["num_docs"] = len(docs)
+
+
+def _measure_doc_store(path: str, results: dict):
+    ds = load_dataset(path, split="train")
+    baseline = current_rss_mb()
+    docs = DocStore.from_dataset(ds)
+    results["doc_store"] = current_rss_mb() - baseline
+    results["num_descriptions"] = docs.num_descriptions
+
+
+@dataclass
+class ScriptArgs:
+    """Compare the resident memory of the dict-of-records corpus and the DocStore. Example usage:
+    python doc_store.py --path param-bharat/rag-hackercup
+    """
+    path: str = "param-bharat/rag-hackercup"  # dataset to load the corpus from
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    with multiprocessing.Manager() as manager:
+        results = manager.dict()
+        # measure each layout in a fresh process so allocations don't leak between runs
+        for target in (_measure_records, _measure_doc_store):
+            process = multiprocessing.Process(target=target, args=(args.path, results))
+            process.start()
+            process.join()
+        results = dict(results)
+
+    logger.info(
+        f"{results['num_docs']} docs, {results['num_descriptions']} unique descriptions"
+    )
+    logger.info(f"Records RSS: {results['records']:.1f} MB")
+    logger.info(f"DocStore RSS: {results['doc_store']:.1f} MB")
+    logger.info(
+        f"Resident-memory reduction: {results['records'] - results['doc_store']:.1f} MB "
+        f"({results['records'] / max(results['doc_store'], 1e-9):.1f}x)"
+    )
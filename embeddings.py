@@ -0,0 +1,102 @@
+import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import simple_parsing
+from datasets import load_dataset
+from sentence_transformers import SentenceTransformer
+
+from doc_store import DocStore
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "jinaai/jina-embeddings-v2-base-code"
+
+
+@lru_cache(maxsize=None)
+def load_embedding_model() -> SentenceTransformer:
+    model = SentenceTransformer(EMBEDDING_MODEL, trust_remote_code=True)
+    # control your input sequence length up to 8192
+    model.max_seq_length = 1024
+    return model
+
+
+def doc_text(doc: dict) -> str:
+    return doc["description"] + " " + doc["code"]
+
+
+def embed_corpus(
+    docs: DocStore,
+    output_path: Path,
+    model: Optional[SentenceTransformer] = None,
+    batch_size: int = 256,
+    encode_batch_size: int = 16,
+) -> np.memmap:
+    """
+    Embeds every doc in the store once and writes the normalized vectors to a float16 `.npy`
+    file whose rows are aligned with the doc ids.
+    """
+    model = model or load_embedding_model()
+    dim = model.get_sentence_embedding_dimension()
+    embeddings = np.lib.format.open_memmap(
+        output_path, mode="w+", dtype=np.float16, shape=(len(docs), dim)
+    )
+    start = time.perf_counter()
+    for batch in docs.iter_batches(batch_size):
+        vectors = model.encode(
+            [doc_text(doc) for doc in batch],
+            batch_size=encode_batch_size,
+            normalize_embeddings=True,
+        )
+        embeddings[batch[0]["doc_id"] : batch[-1]["doc_id"] + 1] = vectors
+        done = batch[-1]["doc_id"] + 1
+        logger.info(
+            f"Embedded {done}/{len(docs)} docs "
+            f"({done / (time.perf_counter() - start):.1f} docs/s)"
+        )
+    embeddings.flush()
+    return embeddings
+
+
+def load_corpus_embeddings(
+    path: Path, num_docs: Optional[int] = None
+) -> Optional[np.ndarray]:
+    """
+    Memory-maps precomputed corpus embeddings. Raises when their row count doesn't match the
+    doc store, since misaligned rows would score the wrong documents.
+    """
+    if not path.exists():
+        return None
+    embeddings = np.load(path, mmap_mode="r")
+    if num_docs is not None and embeddings.shape[0] != num_docs:
+        raise ValueError(
+            f"Corpus embeddings at {path} have {embeddings.shape[0]} rows for {num_docs} docs, "
+            f"rerun embeddings.py for this corpus"
+        )
+    logger.info(f"Loaded corpus embeddings {embeddings.shape} from {path}")
+    return embeddings
+
+
+@dataclass
+class ScriptArgs:
+    """Precompute the rerank embeddings for the whole corpus. Example usage:
+    python embeddings.py --path param-bharat/rag-hackercup --output data/cache/corpus_embeddings.npy
+    """
+    path: str = "param-bharat/rag-hackercup"  # dataset to load the corpus from
+    output: Path = Path("data/cache/corpus_embeddings.npy")  # where to write the embeddings
+    batch_size: int = 256  # docs per write to the memory-mapped matrix
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    docs = DocStore.from_dataset(load_dataset(args.path, split="train"))
+    embed_corpus(docs, args.output, batch_size=args.batch_size)
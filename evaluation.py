@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import statistics
+import time
+from dataclasses import dataclass
+from math import comb
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import simple_parsing
+import weave
+
+from utils import Problem, check_correctness, find_problems, set_concurrency_limits
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+SOLVERS = [
+    "zero_shot",
+    "rag_reflection",
+    "beam_search",
+    "one_shot",
+    "one_shot_o1",
+    "llamaindex_workflow",
+]
+
+
+def load_solver(
+    name: str, timeout: int = 10, retriever_path: str = "param-bharat/rag-hackercup"
+) -> Callable[[Problem], Awaitable[dict]]:
+    """An async callable solving one problem with the named pipeline."""
+    if name == "zero_shot":
+        from agent import zero_shot_solver
+
+        return lambda problem: zero_shot_solver(problem=problem, timeout=timeout)
+    if name == "rag_reflection":
+        from agent import rag_solver_with_reflection
+        from retriever import Retriever
+
+        retriever = Retriever(retriever_path, segments_path=None)
+        # the retriever is shared by concurrent trials, so a trial must not retrieve another
+        # trial's accepted solution to the same problem
+        return lambda problem: rag_solver_with_reflection(
+            retriever=retriever, problem=problem, code_execution_timeout=timeout, remember=False
+        )
+    if name == "beam_search":
+        from beam_search import beam_search_solver
+
+        return lambda problem: beam_search_solver(problem=problem, timeout=timeout)
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown solver {name}, expected one of {SOLVERS}")
+    module = __import__(name)
+    model = module.O1ShotSolver() if name == "one_shot_o1" else module.OneShotSolver()
+    return lambda problem: model.predict(problem.model_dump())
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    """Unbiased estimate of the chance that at least one of k trials passes, from c passes in n."""
+    if n - c < k:
+        return 1.0
+    return 1.0 - comb(n - c, k) / comb(n, k)
+
+
+def trial_statistics(records: List[dict], trials: int, required_passes: int) -> dict:
+    """
+    pass@k over problems and the spread of the solve rate across trials. A missing or failed
+    trial counts as not passed.
+    """
+    passes: Dict[str, List[bool]] = {}
+    for record in records:
+        passes.setdefault(record["problem_name"], [False] * trials)[record["trial"]] = record["passed"]
+    solve_rates = [
+        sum(problem_passes[trial] for problem_passes in passes.values()) / max(len(passes), 1)
+        for trial in range(trials)
+    ]
+    per_problem = {
+        name: {"passes": sum(problem_passes), "solved": sum(problem_passes) >= required_passes}
+        for name, problem_passes in passes.items()
+    }
+    return {
+        "problems": len(passes),
+        "trials": trials,
+        "pass_at_k": {
+            k: statistics.fmean([pass_at_k(trials, sum(p), k) for p in passes.values()] or [0.0])
+            for k in range(1, trials + 1)
+        },
+        f"solved_{required_passes}_of_{trials}": sum(p["solved"] for p in per_problem.values()),
+        "solve_rate_per_trial": solve_rates,
+        "solve_rate_mean": statistics.fmean(solve_rates),
+        "solve_rate_stdev": statistics.stdev(solve_rates) if trials > 1 else 0.0,
+        # how often a problem's result flips between trials, 0 when every trial agrees
+        "flakiness": statistics.fmean(
+            [(sum(p) / trials) * (1 - sum(p) / trials) for p in passes.values()] or [0.0]
+        ),
+        "per_problem": per_problem,
+    }
+
+
+class TrialLog:
+    """Append-only JSONL of finished (problem, trial) pairs, so an interrupted evaluation resumes."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.records: Dict[Tuple[str, int], dict] = {}
+        if path.exists():
+            with path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[(record["problem_name"], record["trial"])] = record
+
+    def __contains__(self, key: Tuple[str, int]) -> bool:
+        return key in self.records
+
+    def record(self, record: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.records[(record["problem_name"], record["trial"])] = record
+
+
+async def score_trial(
+    solver: Callable[[Problem], Awaitable[dict]],
+    problem: Problem,
+    trial: int,
+    full_input: bool = True,
+    timeout: int = 10,
+) -> dict:
+    """
+    Solves the problem once. With `full_input` a solution passing the samples is also run on the
+    full input, which is what the trial is scored on.
+    """
+    start = time.perf_counter()
+    record = {"problem_name": problem.problem_name, "trial": trial, "error": None}
+    try:
+        result = await solver(problem)
+    except Exception as e:
+        logger.error(f"Trial {trial} of {problem.problem_name} failed: {e!r}")
+        return {
+            **record,
+            "status": None,
+            "full_status": None,
+            "passed": False,
+            "wall_time": time.perf_counter() - start,
+            "error": repr(e),
+        }
+
+    test_report = result["test_report"]
+    # the RAG pipeline with a time budget and the o1 pipeline already ran the full input
+    full_report = result.get("full_test_report") or result.get("test_report_full")
+    if (
+        full_report is None
+        and full_input
+        and test_report.status == "passed"
+        and problem.problem_output.exists()
+    ):
+        full_report = await check_correctness(
+            result["solution"].source_code,
+            problem.problem_input.read_text(),
+            problem.problem_output.read_text(),
+            timeout=timeout,
+        )
+    passed = (full_report or test_report).status == "passed"
+    return {
+        **record,
+        "status": test_report.status,
+        "passed_cases": test_report.passed_cases,
+        "total_cases": test_report.total_cases,
+        "full_status": full_report.status if full_report else None,
+        "full_runtime": full_report.runtime if full_report else None,
+        "passed": passed,
+        "wall_time": time.perf_counter() - start,
+        "source_code": result["solution"].source_code,
+    }
+
+
+async def evaluate(
+    solver: Callable[[Problem], Awaitable[dict]],
+    problems: List[Problem],
+    trial_log: TrialLog,
+    trials: int = 3,
+    max_workers: int = 16,
+    full_input: bool = True,
+    timeout: int = 10,
+) -> List[dict]:
+    """
+    Runs every (problem, trial) pair not yet in `trial_log` concurrently, at most `max_workers`
+    at a time, and logs each scored trial as soon as it finishes.
+    """
+    pending = [
+        (problem, trial)
+        for trial in range(trials)
+        for problem in problems
+        if (problem.problem_name, trial) not in trial_log
+    ]
+    logger.info(
+        f"Evaluating {len(problems)} problems x {trials} trials, "
+        f"{len(pending)} runs pending with {max_workers} workers"
+    )
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(problem: Problem, trial: int) -> dict:
+        async with semaphore:
+            return await score_trial(solver, problem, trial, full_input, timeout)
+
+    for i, future in enumerate(asyncio.as_completed([run(p, t) for p, t in pending]), start=1):
+        record = await future
+        trial_log.record(record)
+        logger.info(
+            f"[{i}/{len(pending)}] {record['problem_name']} trial {record['trial']}: "
+            f"{'passed' if record['passed'] else 'failed'} "
+            f"(samples {record['status']}, full input {record['full_status']}, {record['wall_time']:.1f}s)"
+        )
+    return [
+        trial_log.records[(problem.problem_name, trial)]
+        for trial in range(trials)
+        for problem in problems
+        if (problem.problem_name, trial) in trial_log
+    ]
+
+
+@dataclass
+class ScriptArgs:
+    """Evaluate a solver over several trials per problem, running trials and problems concurrently. Example usage:
+    python evaluation.py --solver rag_reflection --problems_folder 2024/practice --trials 3 --llm_concurrency 8 --sandbox_concurrency 4
+    """
+    solver: str = "rag_reflection"  # one of evaluation.SOLVERS
+    problems_folder: Path = Path("2024/practice")  # problems to solve
+    output_dir: Path = Path("data/evals")  # per-trial JSONL and summary, reuse it to resume
+    trials: int = 3  # independent attempts per problem
+    required_passes: int = 2  # trials a problem must pass to count as solved
+    max_workers: int = 16  # (problem, trial) runs in flight
+    llm_concurrency: int = 8  # concurrent LLM requests across all runs, 0 for no cap
+    sandbox_concurrency: int = 4  # concurrent sandboxed programs across all runs, 0 for no cap
+    full_input: bool = True  # score solutions on the full input, not just the samples
+    timeout: int = 10  # code execution timeout in seconds
+    retriever_path: str = "param-bharat/rag-hackercup"  # corpus for the RAG pipeline
+    weave_project: Optional[str] = None  # trace the runs and publish the summary to this weave project
+
+
+async def main(args: ScriptArgs) -> dict:
+    set_concurrency_limits(llm=args.llm_concurrency, sandbox=args.sandbox_concurrency)
+    problems = sorted(find_problems(args.problems_folder), key=lambda p: p.problem_name)
+    trial_log = TrialLog(args.output_dir / f"{args.solver}.jsonl")
+    records = await evaluate(
+        load_solver(args.solver, args.timeout, args.retriever_path),
+        problems,
+        trial_log,
+        trials=args.trials,
+        max_workers=args.max_workers,
+        full_input=args.full_input,
+        timeout=args.timeout,
+    )
+    return trial_statistics(records, args.trials, args.required_passes)
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    if args.weave_project:
+        weave.init(args.weave_project)
+    summary = asyncio.run(main(args))
+    summary_path = args.output_dir / f"{args.solver}_summary.json"
+    summary_path.write_text(json.dumps(summary, indent=2))
+    if args.weave_project:
+        weave.publish(summary, name=f"{args.solver}-trials")
+    pass_at_k_text = ", ".join(f"pass@{k} {v:.2f}" for k, v in summary["pass_at_k"].items())
+    logger.info(
+        f"{args.solver}: {summary[f'solved_{args.required_passes}_of_{args.trials}']}/{summary['problems']} "
+        f"solved in {args.required_passes} of {args.trials} trials, {pass_at_k_text}, "
+        f"solve rate {summary['solve_rate_mean']:.2f} ± {summary['solve_rate_stdev']:.2f}"
+    )
+    logger.info(f"Summary written to {summary_path}")
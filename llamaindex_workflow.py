@@ -28,7 +28,6 @@ os.environ["API_KEY"] = "dummy_key"
 os.environ["MAX_TOKENS"] = "4096"
 os.environ["WEAVE_PARALLELISM"] = "2"
 
-weave.init("llamaindex-workflow")
 
 from utils import Problem, async_client, STRONG_LLM, format_response, check_correctness
 
@@ -39,8 +38,6 @@ logger = logging.getLogger(__name__)
 
 # get dataset
 practice_dataset_uri = "weave:///parambharat/hackercup/object/practice_dataset:R35fXf9N3FE2IOesg7bRPaPAxiE9YbpirhXO9HcHs8w"
-problems_dataset = weave.ref(practice_dataset_uri).get().rows[:]
-problems = list(map(lambda x: Problem(**x), problems_dataset))
 
 class Solution(BaseModel):
     core_question: str = Field(..., description="Core question of the problem")
@@ -179,23 +176,29 @@ class OneShotSolver(weave.Model):
         
         return result
 
-model = OneShotSolver()
-
-evals_dataset = [{"problem": problem.model_dump(), "expected_result": "passed"} for problem in problems]
-
-# #run one example
-# result = asyncio.run(model.predict(evals_dataset[0]["problem"]))
-# print(result)
-
 @weave.op
 def scorer(expected_result: str, model_output: dict) -> dict:
     if model_output is None or model_output["test_report"].status is None:
         return {"solution_passed": False}
     return {"solution_passed": expected_result == model_output["test_report"].status}
 
-logger.info("Creating evaluator")
-evaluator = weave.Evaluation(dataset=evals_dataset, scorers=[scorer], trials=1)
 
-logger.info(f"Evaluating model: {model}")
-results = asyncio.run(evaluator.evaluate(model))
-logger.info(f"Evaluation results: {results}")
+if __name__ == "__main__":
+    weave.init("llamaindex-workflow")
+
+    problems_dataset = weave.ref(practice_dataset_uri).get().rows[:]
+    problems = list(map(lambda x: Problem(**x), problems_dataset))
+
+    model = OneShotSolver()
+    evals_dataset = [{"problem": problem.model_dump(), "expected_result": "passed"} for problem in problems]
+
+    # #run one example
+    # result = asyncio.run(model.predict(evals_dataset[0]["problem"]))
+    # print(result)
+
+    logger.info("Creating evaluator")
+    evaluator = weave.Evaluation(dataset=evals_dataset, scorers=[scorer], trials=1)
+
+    logger.info(f"Evaluating model: {model}")
+    results = asyncio.run(evaluator.evaluate(model))
+    logger.info(f"Evaluation results: {results}")
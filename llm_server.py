@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import simple_parsing
+from aiohttp import ClientSession, web
+
+logging.basicConfig(
+    format="%(asctime)s : %(levelname)s : %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+API_KEY = os.getenv("API_KEY", "dummy_key")
+
+# request fields that don't change the completion
+VOLATILE_FIELDS = ("stream", "user")
+
+
+def request_key(body: dict) -> str:
+    request = {key: value for key, value in body.items() if key not in VOLATILE_FIELDS}
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded chat completions keyed by request hash, persisted as an append-only JSONL file.
+    A request recorded several times (sampled completions) replays its recordings in order.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.recordings: Dict[str, List[dict]] = defaultdict(list)
+        self.replays: Dict[str, int] = defaultdict(int)
+        if path.exists():
+            with path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a write cut short by a crash
+                        continue
+                    self.recordings[record["key"]].append(record["response"])
+            logger.info(f"Loaded {sum(map(len, self.recordings.values()))} recordings from {path}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.recordings
+
+    def replay(self, key: str) -> dict:
+        responses = self.recordings[key]
+        response = responses[self.replays[key] % len(responses)]
+        self.replays[key] += 1
+        return response
+
+    def record(self, key: str, request: dict, response: dict):
+        self.recordings[key].append(response)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(json.dumps({"key": key, "request": request, "response": response}) + "\n")
+
+
+class LatencyModel:
+    """
+    Simulated provider timing: a time to first token drawn from `latency`, plus the completion
+    streamed at `tokens_per_second`. `latency` is "fixed:S", "uniform:LOW,HIGH" or
+    "lognormal:MEDIAN,SIGMA" in seconds.
+    """
+
+    def __init__(self, latency: str = "fixed:0", tokens_per_second: float = 0.0, seed: int = 0):
+        kind, _, params = latency.partition(":")
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")] if params else [0.0]
+        self.tokens_per_second = tokens_per_second
+        self.rng = random.Random(seed)
+
+    def first_token(self) -> float:
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return self.rng.lognormvariate(math.log(median), sigma)
+        return self.params[0]
+
+    def delay(self, completion_tokens: int) -> float:
+        generation = completion_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        return self.first_token() + generation
+
+
+class ErrorInjector:
+    """Fails a `rate` fraction of requests with one of `codes`, deterministically by seed."""
+
+    MESSAGES = {
+        429: ("rate_limit_exceeded", "Rate limit reached, please retry after a short wait."),
+        500: ("server_error", "The server had an error while processing your request."),
+        502: ("server_error", "Bad gateway."),
+        503: ("server_error", "The engine is currently overloaded, please try again later."),
+    }
+
+    def __init__(self, rate: float = 0.0, codes: List[int] = (429, 500, 503), seed: int = 0):
+        self.rate = rate
+        self.codes = list(codes)
+        self.rng = random.Random(seed)
+
+    def maybe_fail(self) -> Optional[web.Response]:
+        if self.rate <= 0 or self.rng.random() >= self.rate:
+            return None
+        status = self.rng.choice(self.codes)
+        error_type, message = self.MESSAGES.get(status, ("server_error", "Injected error."))
+        headers = {"retry-after": "1"} if status == 429 else {}
+        return web.json_response(
+            {"error": {"message": message, "type": error_type, "code": status}},
+            status=status,
+            headers=headers,
+        )
+
+
+class ReplayServer:
+    """
+    OpenAI-compatible stand-in for `BASE_URL`. In "record" mode requests are forwarded to the
+    upstream provider and saved, in "replay" mode they are answered from the cassette only and
+    in "auto" mode recordings are replayed and misses are recorded.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        mode: str = "replay",
+        upstream_url: Optional[str] = None,
+        api_key: str = API_KEY,
+        latency: Optional[LatencyModel] = None,
+        errors: Optional[ErrorInjector] = None,
+    ):
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if mode != "replay" and not upstream_url:
+            raise ValueError(f"{mode} mode needs an upstream_url")
+        self.cassette = cassette
+        self.mode = mode
+        self.upstream_url = upstream_url.rstrip("/") if upstream_url else None
+        self.api_key = api_key
+        self.latency = latency or LatencyModel()
+        self.errors = errors or ErrorInjector()
+        self.session: Optional[ClientSession] = None
+        self.stats = defaultdict(int)
+
+    async def forward(self, body: dict) -> Tuple[int, dict]:
+        if self.session is None:
+            self.session = ClientSession()
+        async with self.session.post(
+            f"{self.upstream_url}/chat/completions",
+            json=body,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        ) as response:
+            payload = await response.json()
+            return response.status, payload
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get("stream"):
+            return web.json_response(
+                {"error": {"message": "Streaming is not supported by the replay server."}},
+                status=400,
+            )
+        error = self.errors.maybe_fail()
+        if error is not None:
+            self.stats["injected_errors"] += 1
+            return error
+
+        key = request_key(body)
+        if self.mode != "record" and key in self.cassette:
+            self.stats["replayed"] += 1
+            response = self.cassette.replay(key)
+            completion_tokens = response.get("usage", {}).get("completion_tokens", 0)
+            await asyncio.sleep(self.latency.delay(completion_tokens))
+            return web.json_response(response)
+        if self.mode == "replay":
+            self.stats["misses"] += 1
+            logger.warning(f"No recording for request {key[:12]} ({body.get('model')})")
+            return web.json_response(
+                {"error": {"message": f"No recording for request {key}", "type": "not_found"}},
+                status=404,
+            )
+
+        start = time.perf_counter()
+        status, payload = await self.forward(body)
+        if status == 200:
+            self.stats["recorded"] += 1
+            self.cassette.record(key, body, payload)
+        else:
+            self.stats["upstream_errors"] += 1
+        logger.info(f"Forwarded request {key[:12]}: {status} in {time.perf_counter() - start:.1f}s")
+        return web.json_response(payload, status=status)
+
+    async def models(self, request: web.Request) -> web.Response:
+        models = {
+            response.get("model")
+            for responses in self.cassette.recordings.values()
+            for response in responses
+        }
+        return web.json_response(
+            {"object": "list", "data": [{"id": m, "object": "model"} for m in sorted(filter(None, models))]}
+        )
+
+    async def close(self, app: web.Application):
+        if self.session is not None:
+            await self.session.close()
+        logger.info(f"Replay server stats: {dict(self.stats)}")
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        for prefix in ("", "/v1"):
+            app.router.add_post(f"{prefix}/chat/completions", self.chat_completions)
+            app.router.add_get(f"{prefix}/models", self.models)
+        app.on_cleanup.append(self.close)
+        return app
+
+
+@dataclass
+class ScriptArgs:
+    """Serve recorded chat completions as an OpenAI-compatible API. Example usage:
+    python llm_server.py --mode record --upstream_url https://api.mistral.ai/v1 --cassette data/cassettes/practice.jsonl
+    python llm_server.py --mode replay --cassette data/cassettes/practice.jsonl --latency lognormal:1.5,0.4 --tokens_per_second 60
+    then point the pipelines at it with BASE_URL=http://localhost:8000/v1
+    """
+    cassette: Path = Path("data/cassettes/recordings.jsonl")  # recorded completions
+    mode: str = "replay"  # record, replay or auto (replay hits, record misses)
+    upstream_url: Optional[str] = None  # provider to forward to when recording
+    host: str = "127.0.0.1"
+    port: int = 8000
+    latency: str = "fixed:0"  # time to first token: fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA
+    tokens_per_second: float = 0.0  # simulated generation speed of replays, 0 for instant
+    error_rate: float = 0.0  # fraction of requests failed with an injected error
+    error_codes: str = "429,500,503"  # status codes of injected errors
+    seed: int = 0  # seed of the latency and error draws
+
+
+if __name__ == "__main__":
+    args = simple_parsing.parse(ScriptArgs)
+    server = ReplayServer(
+        Cassette(args.cassette),
+        mode=args.mode,
+        upstream_url=args.upstream_url,
+        latency=LatencyModel(args.latency, args.tokens_per_second, args.seed),
+        errors=ErrorInjector(
+            args.error_rate, [int(code) for code in args.error_codes.split(",")], args.seed
+        ),
+    )
+    web.run_app(server.app(), host=args.host, port=args.port)
@@ -0,0 +1,227 @@
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds, from a cache hit to a slow reasoning-model call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout, plus min and max."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimated by linear interpolation within the bucket holding the q-th observation."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, self.min), self.max)
+            seen += count
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe in-process registry of counters and histograms, labelled like Prometheus
+    metrics. Nothing leaves the process unless exported.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            series.setdefault(_labels(labels), Histogram()).observe(value)
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def timed(self, stage: str):
+        """Decorator recording every call of a sync or async function as `stage`."""
+
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(stage):
+                        return await fn(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_json(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                "histograms": {
+                    name: [{"labels": dict(labels), **h.as_dict()} for labels, h in series.items()]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "hackercup_") -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(
+                        [str(b) for b in histogram.buckets] + ["+Inf"], histogram.counts
+                    ):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels + (("le", bound),))
+                        lines.append(f"{prefix}{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Writes Prometheus text for a `.prom` path and JSON otherwise."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".prom":
+            path.write_text(self.to_prometheus())
+        else:
+            path.write_text(json.dumps(self.to_json(), indent=2))
+        logger.info(f"Metrics written to {path}")
+
+    def summary(self) -> str:
+        rows = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                for labels, h in sorted(series.items()):
+                    rows.append(
+                        f"{name}{_format_labels(labels):<45} n={h.count:<6} total={h.sum:9.2f}s "
+                        f"p50={h.quantile(0.5):8.3f}s p95={h.quantile(0.95):8.3f}s max={h.max:8.3f}s"
+                    )
+            for name, series in sorted(self.counters.items()):
+                for labels, value in sorted(series.items()):
+                    rows.append(f"{name}{_format_labels(labels):<45} {value:,.0f}")
+        return "\n".join(rows)
+
+    def log_summary(self):
+        logger.info("Profile:\n" + self.summary())
+
+
+metrics = Metrics()
+
+
+def instrument_llm_client(client, name: Optional[str] = None):
+    """
+    Records latency, token usage and errors of every `chat.completions.create` call made through
+    an `openai.AsyncOpenAI` client. Must run before the client is wrapped by instructor, which
+    captures the method.
+    """
+    completions = client.chat.completions
+
+    async def instrumented_create(*args, **kwargs):
+        model = kwargs.get("model", name or "unknown")
+        start = time.perf_counter()
+        try:
+            # resolved per call so tracing patches applied to the class later still take effect
+            response = await type(completions).create(completions, *args, **kwargs)
+        except Exception as e:
+            metrics.inc("llm_errors", model=model, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe("llm_request_seconds", time.perf_counter() - start, model=model)
+        metrics.inc("llm_calls", model=model)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.inc("llm_prompt_tokens", usage.prompt_tokens or 0, model=model)
+            metrics.inc("llm_completion_tokens", usage.completion_tokens or 0, model=model)
+        return response
+
+    completions.create = instrumented_create
+    return client
+
+
+async def count_http_attempt(response):
+    """httpx response hook: every HTTP attempt, so transport retries show up as attempts minus calls."""
+    metrics.inc("llm_http_attempts", status=response.status_code)
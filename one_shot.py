@@ -5,7 +5,6 @@ import logging
 from pydantic import BaseModel, Field
 
 WEAVE_PROJECT = "ai-hacker-cup"
-weave_client = weave.init(WEAVE_PROJECT)
 
 os.environ["FAST_LLM"] = "gpt-4o"
 os.environ["STRONG_LLM"] = "o1-preview"
@@ -15,6 +14,7 @@ os.environ["WEAVE_PARALLELISM"] = "5"
 
 
 # Start of workout
+from tracing import traced_op
 from utils import Problem, async_client, STRONG_LLM, format_response, check_correctness
 
 logging.basicConfig(
@@ -22,10 +22,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# get dataset
 practice_dataset_uri = "weave:///parambharat/hackercup/object/practice_dataset:R35fXf9N3FE2IOesg7bRPaPAxiE9YbpirhXO9HcHs8w"
-problems_dataset = weave.ref(practice_dataset_uri).get().rows[:]
-problems = list(map(lambda x: Problem(**x), problems_dataset))
 
 
 class Solution(BaseModel):
@@ -70,7 +67,7 @@ Output:
 {sample_output}
 """
 
-@weave.op
+@traced_op
 async def one_shot_solver(
     problem: Problem, 
     system_prompt: str, 
@@ -80,7 +77,7 @@ async def one_shot_solver(
 ) -> str:
     logging.info(f"Solving problem: {problem.problem_name}")
 
-    @weave.op
+    @traced_op(level="full")
     def format_prompt(system_prompt: str, prompt_template: str, problem: Problem) -> str:
         return system_prompt + prompt_template.format(
             problem_description=problem.problem_description,
@@ -123,7 +120,7 @@ class OneShotSolver(weave.Model):
     prompt_template: str = prompt_template
     temperature: float = 0.7
 
-    @weave.op
+    @traced_op
     async def predict(self, problem: dict):
         return await one_shot_solver(
             problem=Problem(**problem), 
@@ -132,11 +129,7 @@ class OneShotSolver(weave.Model):
             timeout=self.code_execution_timeout,
             temperature=self.temperature
         )
-    
-model = OneShotSolver()
-
 
-evals_dataset = [{"problem": problem.model_dump(), "expected_result": "passed"} for problem in problems]
 
 @weave.op
 def scorer(expected_result: str, model_output: dict) -> dict:
@@ -144,9 +137,20 @@ def scorer(expected_result: str, model_output: dict) -> dict:
         return {"solution_passed": False}
     return {"solution_passed": expected_result == model_output["test_report"]}
 
-logger.info("Creating evaluator")
-evaluator = weave.Evaluation(dataset=evals_dataset, scorers=[scorer], trials=1)
 
-logger.info(f"Evaluating model: {model}")
-results = asyncio.run(evaluator.evaluate(model))
-logger.info(f"Evaluation results: {results}")
+if __name__ == "__main__":
+    weave_client = weave.init(WEAVE_PROJECT)
+
+    # get dataset
+    problems_dataset = weave.ref(practice_dataset_uri).get().rows[:]
+    problems = list(map(lambda x: Problem(**x), problems_dataset))
+
+    model = OneShotSolver()
+    evals_dataset = [{"problem": problem.model_dump(), "expected_result": "passed"} for problem in problems]
+
+    logger.info("Creating evaluator")
+    evaluator = weave.Evaluation(dataset=evals_dataset, scorers=[scorer], trials=1)
+
+    logger.info(f"Evaluating model: {model}")
+    results = asyncio.run(evaluator.evaluate(model))
+    logger.info(f"Evaluation results: {results}")
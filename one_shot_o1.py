@@ -6,7 +6,6 @@ from pathlib import Path
 from pydantic import BaseModel, Field
 
 WEAVE_PROJECT = "ai-hacker-cup"
-weave_client = weave.init(WEAVE_PROJECT)
 
 STRONG_LLM = "o1-preview"
 FAST_LLM = "gpt-4o"
@@ -16,6 +15,7 @@ os.environ["WEAVE_PARALLELISM"] = "5"
 
 
 # Start of workout
+from tracing import traced_op
 from utils import async_client, format_response, check_correctness, find_problems, Problem, maybe_remove_backticks
 
 logging.basicConfig(
@@ -23,9 +23,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# get current dataset!
 ds2024 = Path("./2024/practice")
-problems = find_problems(ds2024)
 
 class Solution(BaseModel):
     solution_explanation: str = Field(..., description="Explanation of the solution to the problem")
@@ -55,7 +53,7 @@ Write the final solution in Python3 programming language to solve the problem.
 {sample_output}
 """
 
-@weave.op
+@traced_op
 async def o1_solver(
     problem: Problem, 
     prompt_template: str,
@@ -63,7 +61,7 @@ async def o1_solver(
 ) -> str:
     logging.info(f"Solving problem: {problem.problem_name}")
 
-    @weave.op
+    @traced_op(level="full")
     def format_prompt(prompt_template: str, problem: Problem) -> str:
         return prompt_template.format(
             problem_description=problem.problem_description,
@@ -116,17 +114,14 @@ class O1ShotSolver(weave.Model):
     llm_model: str = STRONG_LLM
     prompt_template: str = prompt_template
 
-    @weave.op
+    @traced_op
     async def predict(self, problem: dict):
         return await o1_solver(
             problem=Problem(**problem), 
             prompt_template=self.prompt_template, 
             timeout=self.code_execution_timeout,
         )
-    
-model = O1ShotSolver()
 
-evals_dataset = [{"problem": problem.model_dump(), "expected_result": "passed"} for problem in problems]
 
 @weave.op
 def scorer(expected_result: str, model_output: dict) -> dict:
@@ -135,9 +130,19 @@ def scorer(expected_result: str, model_output: dict) -> dict:
     return {"passed_sample": expected_result == model_output["test_report"].status,
             "passed_full": expected_result == model_output["test_report_full"].status}
 
-logger.info("Creating evaluator")
-evaluator = weave.Evaluation(dataset=evals_dataset, scorers=[scorer], trials=1)
 
-logger.info(f"Evaluating model: {model}")
-results = asyncio.run(evaluator.evaluate(model))
-logger.info(f"Evaluation results: {results}")
+if __name__ == "__main__":
+    weave_client = weave.init(WEAVE_PROJECT)
+
+    # get current dataset!
+    problems = find_problems(ds2024)
+
+    model = O1ShotSolver()
+    evals_dataset = [{"problem": problem.model_dump(), "expected_result": "passed"} for problem in problems]
+
+    logger.info("Creating evaluator")
+    evaluator = weave.Evaluation(dataset=evals_dataset, scorers=[scorer], trials=1)
+
+    logger.info(f"Evaluating model: {model}")
+    results = asyncio.run(evaluator.evaluate(model))
+    logger.info(f"Evaluation results: {results}")
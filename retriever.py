@@ -1,18 +1,32 @@
 import ast
+import asyncio
+import hashlib
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
 
 import bm25s
+import numpy as np
 import pandas as pd
-import weave
+import pyarrow as pa
 from datasets import load_dataset
 from joblib import Parallel, delayed
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
 from simple_parsing import ArgumentParser
 
+from ann_index import IVFIndex
+from dedup import deduplicate_solutions
+from doc_store import DocStore
+from embeddings import doc_text, load_corpus_embeddings, load_embedding_model
+from metrics import metrics
+from tracing import traced_op
 from utils import Problem, Solution, clean_code_string, remove_extra_newlines
 
 logging.basicConfig(
@@ -21,6 +35,15 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+CORPUS_EMBEDDINGS = os.getenv("CORPUS_EMBEDDINGS", "data/cache/corpus_embeddings.npy")
+DENSE_INDEX = os.getenv("DENSE_INDEX", "data/cache/ivf_index.npz")
+# persisting accepted solutions is opt-in, otherwise later runs would retrieve their own answers
+SOLVED_DOCS = os.getenv("SOLVED_DOCS")
+RERANK_MAX_BATCH_SIZE = int(os.getenv("RERANK_MAX_BATCH_SIZE", 8))
+RERANK_MAX_WAIT = float(os.getenv("RERANK_MAX_WAIT", 0.02))
+CORPUS_SHARD_SIZE = int(os.getenv("CORPUS_SHARD_SIZE", 256))
+CORPUS_WORKERS = int(os.getenv("CORPUS_WORKERS", 4))
+
 # Data Loading
 
 LANGUAGE_MAP = {
@@ -63,33 +86,93 @@ def clean_description(row: dict) -> dict:
     return {"description": description}
 
 
-def get_code_contests_data(cache_file: Path, reload_cache: bool = False):
+# the only CodeContests columns the corpus is built from
+CORPUS_SOURCE_COLUMNS = ["description", "solutions", "public_tests", "is_description_translated"]
+
+
+def transform_rows(rows: List[dict]) -> List[dict]:
+    """
+    Every corpus transform for a shard of CodeContests rows in one pass: drops translated
+    descriptions and problems without Python solutions, then emits one cleaned record per solution.
+    """
+    records = []
+    for row in rows:
+        if row["is_description_translated"]:
+            continue
+        solutions = get_solution(row)["code"]
+        if not solutions:
+            continue
+        description = clean_description(row)["description"]
+        test_cases = get_test_cases(row)
+        for code in clean_code({"code": solutions})["code"]:
+            records.append({"description": description, "code": code, **test_cases})
+    return records
+
+
+def iter_shards(rows: Iterable[dict], shard_size: int) -> Iterator[List[dict]]:
+    shard = []
+    for row in rows:
+        shard.append(row)
+        if len(shard) == shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def build_code_contests_corpus(
+    cache_file: Path,
+    shard_size: int = CORPUS_SHARD_SIZE,
+    num_workers: int = CORPUS_WORKERS,
+    limit: Optional[int] = None,
+) -> int:
+    """
+    Streams the CodeContests train split through `transform_rows` on a process pool and writes
+    the solutions to JSONL, dropping exact duplicate code (first occurrence kept). Shards are
+    written in dataset order and at most two per worker are in flight, so memory is bounded by
+    the shard size plus a 16-byte hash per distinct solution. Returns the number of solutions.
+    """
+    logger.info(f"Streaming raw data from dataset with {num_workers} workers")
+    ds = load_dataset("deepmind/code_contests", split="train", streaming=True)
+    ds = ds.select_columns(CORPUS_SOURCE_COLUMNS)
+    if limit is not None:
+        ds = ds.take(limit)
+
+    seen = set()
+    written = 0
+    tmp_file = cache_file.with_suffix(".tmp")
+    tmp_file.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(records: List[dict]):
+        nonlocal written
+        for record in records:
+            key = code_hash(record["code"])
+            if key in seen:
+                continue
+            seen.add(key)
+            f.write(json.dumps(record) + "\n")
+            written += 1
+
+    with ProcessPoolExecutor(num_workers) as pool, tmp_file.open("w") as f:
+        pending = deque()
+        for shard in iter_shards(ds, shard_size):
+            pending.append(pool.submit(transform_rows, shard))
+            if len(pending) >= 2 * num_workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    # written under a temporary name so an interrupted build never leaves a partial cache
+    tmp_file.replace(cache_file)
+    logger.info(f"Wrote {written} solutions to {cache_file}")
+    return written
+
+
+def get_code_contests_data(cache_file: Path, reload_cache: bool = False) -> pd.DataFrame:
     if cache_file.exists() and not reload_cache:
         logger.info(f"Loading cached raw data from {cache_file}")
-        return pd.read_json(cache_file, lines=True)
-
-    logger.info(f"Loading raw data from dataset")
-    ds = load_dataset("deepmind/code_contests")
-
-    train_ds = ds["train"].map(get_solution, num_proc=4)
-    train_ds = train_ds.filter(lambda x: not x["is_description_translated"], num_proc=4)
-    train_ds = train_ds.filter(lambda x: len(x["code"]) > 0, num_proc=4)
-    train_ds = train_ds.map(clean_code, num_proc=4)
-    train_ds = train_ds.map(clean_description, num_proc=4)
-    train_ds = train_ds.map(get_test_cases, num_proc=4)
-    train_ds = train_ds.remove_columns(
-        [
-            col
-            for col in train_ds.column_names
-            if col not in ["description", "code", "sample_inputs", "sample_outputs"]
-        ]
-    )
-
-    train_df = train_ds.to_pandas()
-    train_df = train_df.explode("code").reset_index(drop=True)
-    train_df = train_df.drop_duplicates(subset=["code"], keep="first")
-    train_df.to_json(cache_file, orient="records", lines=True)
-    return train_df
+    else:
+        build_code_contests_corpus(cache_file)
+    return pd.read_json(cache_file, lines=True)
 
 
 # Data Preprocessing
@@ -127,8 +210,28 @@ TOKEN_MAP = {
 }
 
 
+# Flat type -> token table for the iterative tokenizer, ast.Constant is resolved by value type
+NODE_TOKENS = {
+    node_type: token for node_type, token in TOKEN_MAP.items() if not callable(token)
+}
+CONSTANT_TOKENS = {
+    int: "NUMBER",
+    float: "NUMBER",
+    complex: "NUMBER",
+    bool: "NUMBER",  # bool is an int, TOKEN_MAP never reaches its BOOLEAN branch
+    str: "STRING",
+    type(None): "NONE",
+}
+
+NORMALIZE_CACHE_SIZE = 100_000
+_normalize_cache: OrderedDict = OrderedDict()
+
+
 def tokenize_node(node):
-    """Tokenizes an AST node using the TOKEN_MAP dictionary."""
+    """
+    Tokenizes an AST node using the TOKEN_MAP dictionary.
+    Reference implementation of `tokenize_tree`, kept for the normalization benchmark.
+    """
     node_type = type(node)
 
     # Handle the case where the node type is in the TOKEN_MAP
@@ -146,26 +249,98 @@ def tokenize_node(node):
         yield from tokenize_node(child)
 
 
+def tokenize_tree(tree: ast.AST) -> List[str]:
+    """Tokenizes an AST in the same pre-order as `tokenize_node`, using an explicit stack."""
+    tokens = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        token = NODE_TOKENS.get(node_type)
+        if token is not None:
+            tokens.append(token)
+        elif node_type is ast.Constant:
+            tokens.append(CONSTANT_TOKENS.get(type(node.value), "UNKNOWN"))
+
+        # push children in reverse so they are popped in source order
+        for field in reversed(node._fields):
+            value = getattr(node, field, None)
+            if isinstance(value, ast.AST):
+                stack.append(value)
+            elif isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, ast.AST):
+                        stack.append(item)
+    return tokens
+
+
 def normalize_code(code: str) -> Optional[str]:
     """Tokenizes and normalizes any Python code snippet."""
     try:
         tree = ast.parse(code)
-    except SyntaxError as e:
+    except (SyntaxError, ValueError) as e:
         return None
 
-    tokens = list(tokenize_node(tree))
-    return " ".join(tokens)
+    return " ".join(tokenize_tree(tree))
+
+
+def normalize_code_chunk(code_list: List[str]) -> List[Optional[str]]:
+    return [normalize_code(code) for code in code_list]
 
-@weave.op
-def normalize_code_list(code_list: list[str]) -> list[str]:
-    if len(code_list) > 1000:
-        return Parallel(n_jobs=-1)(delayed(normalize_code)(code) for code in code_list)
+
+def code_hash(code: str) -> bytes:
+    return hashlib.blake2b(code.encode(), digest_size=16).digest()
+
+
+@traced_op(level="full")
+def normalize_code_list(code_list: list[str], chunk_size: int = 2000) -> list[str]:
+    """
+    Normalizes a list of snippets, skipping duplicates and snippets already seen (by content hash).
+    Large lists are split into chunks so each process pool task amortizes its pickling overhead.
+    """
+    keys = [code_hash(code) for code in code_list]
+    missing = {}
+    for key, code in zip(keys, code_list):
+        if key not in _normalize_cache and key not in missing:
+            missing[key] = code
+
+    codes = list(missing.values())
+    if len(codes) > 1000:
+        chunks = [codes[i : i + chunk_size] for i in range(0, len(codes), chunk_size)]
+        results = Parallel(n_jobs=-1)(
+            delayed(normalize_code_chunk)(chunk) for chunk in chunks
+        )
+        normalized = [item for chunk in results for item in chunk]
     else:
-        return [normalize_code(code) for code in code_list]
+        normalized = normalize_code_chunk(codes)
+
+    _normalize_cache.update(zip(missing, normalized))
+    outputs = [_normalize_cache[key] for key in keys]
+    # evict the oldest entries so the cache stays bounded on corpus-sized inputs
+    while len(_normalize_cache) > NORMALIZE_CACHE_SIZE:
+        _normalize_cache.popitem(last=False)
+    return outputs
+
+
+def normalize_query(query: str) -> str:
+    """Cleans and normalizes a retrieval query, falling back to an empty query on syntax errors."""
+    clean_query = clean_code_string(query)
+    return normalize_code(clean_query) or ""
+
+
+def normalize_query_list(queries: list[str]) -> list[str]:
+    if len(queries) > 16:
+        return Parallel(n_jobs=-1)(delayed(normalize_query)(query) for query in queries)
+    else:
+        return [normalize_query(query) for query in queries]
 
 
 def preprocess_data(
-    input_path: Path, output_path: Path, reload_cache: bool = False
+    input_path: Path,
+    output_path: Path,
+    reload_cache: bool = False,
+    dedup_threshold: Optional[float] = 0.85,
+    max_per_problem: int = 10,
 ) -> pd.DataFrame:
     if output_path.exists() and not reload_cache:
         logger.info(f"Loading cached preprocessed data from {output_path}")
@@ -175,32 +350,321 @@ def preprocess_data(
     data_df = pd.read_json(input_path, lines=True)
     data_df["normalized_code"] = normalize_code_list(data_df["code"].tolist())
     data_df = data_df.dropna(subset=["normalized_code"])
+    if dedup_threshold is not None:
+        data_df = deduplicate_solutions(data_df, dedup_threshold, max_per_problem)
     data_df.to_json(output_path, orient="records", lines=True)
     return data_df
 
 
+def reciprocal_rank_fusion(
+    rankings: List[Sequence[int]], k: int = 10, rrf_k: int = 60
+) -> List[int]:
+    """Fuses several ranked lists of doc ids with reciprocal rank fusion."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[int(doc_id)] = scores.get(int(doc_id), 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def build_bm25_index(corpus: List[str], show_progress: bool = True) -> bm25s.BM25:
+    corpus_tokens = bm25s.tokenize(corpus, stopwords=None, show_progress=show_progress)
+    retriever = bm25s.BM25()
+    retriever.index(corpus_tokens, show_progress=show_progress)
+    return retriever
+
+
+@dataclass
+class BM25Stats:
+    """
+    Document frequencies and lengths of the main corpus, so docs indexed after it score on the
+    same scale as the main index (bm25s' default Lucene BM25).
+    """
+    doc_freqs: Dict[str, int]
+    num_docs: int
+    avg_doc_len: float
+    k1: float = 1.5
+    b: float = 0.75
+
+    @classmethod
+    def from_tokens(cls, tokens: bm25s.tokenization.Tokenized) -> "BM25Stats":
+        doc_freqs = np.zeros(len(tokens.vocab), dtype=np.int64)
+        for ids in tokens.ids:
+            doc_freqs[np.unique(ids)] += 1
+        return cls(
+            doc_freqs={token: int(doc_freqs[i]) for token, i in tokens.vocab.items()},
+            num_docs=len(tokens.ids),
+            avg_doc_len=float(np.mean([len(ids) for ids in tokens.ids])) if tokens.ids else 1.0,
+        )
+
+    def index(self, corpus: List[str]) -> bm25s.BM25:
+        """
+        A BM25 index of `corpus` scored with the idf and average doc length of the main corpus
+        plus `corpus` itself, instead of the statistics of `corpus` alone.
+        """
+        tokens = bm25s.tokenize(corpus, stopwords=None, show_progress=False)
+        vocab = sorted(tokens.vocab, key=tokens.vocab.get)
+        doc_indices, token_ids, term_freqs, doc_lens = [], [], [], []
+        for doc, ids in enumerate(tokens.ids):
+            unique_ids, counts = np.unique(np.asarray(ids, dtype=np.int64), return_counts=True)
+            doc_indices.append(np.full(len(unique_ids), doc))
+            token_ids.append(unique_ids)
+            term_freqs.append(counts)
+            doc_lens.append(np.full(len(unique_ids), len(ids)))
+        doc_indices, token_ids, term_freqs, doc_lens = (
+            np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            for parts in (doc_indices, token_ids, term_freqs, doc_lens)
+        )
+
+        segment_freqs = np.bincount(token_ids, minlength=len(vocab))
+        doc_freqs = segment_freqs + np.array([self.doc_freqs.get(token, 0) for token in vocab])
+        num_docs = self.num_docs + len(tokens.ids)
+        idf = np.log(1 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lens / self.avg_doc_len)
+        scores = idf[token_ids] * term_freqs / (term_freqs + length_norm)
+
+        # bm25s keeps scores as a docs x vocab CSC matrix: doc indices grouped by token
+        order = np.lexsort((doc_indices, token_ids))
+        index = bm25s.BM25(k1=self.k1, b=self.b)
+        index.scores = {
+            "data": scores[order].astype(index.dtype),
+            "indices": doc_indices[order].astype(index.int_dtype),
+            "indptr": np.concatenate([[0], np.cumsum(segment_freqs)]).astype(index.int_dtype),
+            "num_docs": len(tokens.ids),
+        }
+        index.vocab_dict = tokens.vocab
+        index.nonoccurrence_array = None
+        return index
+
+
+def prepare_doc(doc: dict) -> Optional[dict]:
+    """Cleans a new problem/solution pair the same way the corpus was built, None if it doesn't parse."""
+    code = clean_code_string(doc["code"])
+    normalized_code = normalize_code(code)
+    if normalized_code is None:
+        return None
+    return {
+        "description": remove_extra_newlines(doc["description"]),
+        "code": code,
+        "sample_inputs": doc.get("sample_inputs", ""),
+        "sample_outputs": doc.get("sample_outputs", ""),
+        "normalized_code": normalized_code,
+    }
+
+
+class Segment:
+    """
+    A small BM25-indexed batch of docs added after the main corpus was indexed.
+    Its doc ids continue the main corpus ids starting at `offset`.
+    """
+
+    def __init__(self, rows: List[dict], offset: int, stats: BM25Stats):
+        self.rows = rows
+        self.offset = offset
+        self.docs = DocStore.from_table(pa.Table.from_pylist(rows), id_offset=offset)
+        # scored with the main corpus statistics so segment and main scores are comparable
+        self.index = stats.index(self.docs.column("normalized_code"))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
 class Retriever:
-    def __init__(self, path: str = "param-bharat/rag-hackercup"):
+    def __init__(
+        self,
+        path: str = "param-bharat/rag-hackercup",
+        mode: str = "bm25",
+        dense_index_path: Path = Path(DENSE_INDEX),
+        n_probe: int = 8,
+        fusion_depth: int = 100,
+        segments_path: Optional[Path] = Path(SOLVED_DOCS) if SOLVED_DOCS else None,
+        max_segments: int = 4,
+    ):
+        if mode not in ("bm25", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
         ds = load_dataset(path, split="train")
-        data_df = ds.to_pandas()
-        self.docs = data_df.to_dict(orient="records")
-        self.corpus = data_df["normalized_code"]
+        self.docs = DocStore.from_dataset(ds)
+        rerank_model.load_corpus(len(self.docs))
         self.retriever = self.index()
+        self.mode = mode
+        self.n_probe = n_probe
+        self.fusion_depth = fusion_depth
+        self.dense_index = (
+            self.load_dense_index(dense_index_path) if mode == "hybrid" else None
+        )
+
+        # incremental segments are swapped as a whole under the lock, readers use a snapshot
+        self.segments: List[Segment] = []
+        self.segments_path = segments_path
+        self.max_segments = max_segments
+        self._segments_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self.load_segments()
 
     def index(self):
-        corpus = self.corpus.tolist()
-        corpus_tokens = bm25s.tokenize(corpus, stopwords=None)
-        retriever = bm25s.BM25(corpus=corpus)
+        corpus_tokens = bm25s.tokenize(self.docs.column("normalized_code"), stopwords=None)
+        self.stats = BM25Stats.from_tokens(corpus_tokens)
+        retriever = bm25s.BM25()
         retriever.index(corpus_tokens)
         return retriever
 
-    @weave.op
-    def retrieve(self, query: str, k: int = 10):
-        clean_query = clean_code_string(query)
-        normalized_query = normalize_code(clean_query)
+    def __len__(self) -> int:
+        return len(self.docs) + sum(len(segment) for segment in self.segments)
+
+    def load_segments(self):
+        if self.segments_path is None or not self.segments_path.exists():
+            return
+        rows = pd.read_json(self.segments_path, lines=True).to_dict(orient="records")
+        if rows:
+            logger.info(f"Loading {len(rows)} added docs from {self.segments_path}")
+            self.segments = [Segment(rows, offset=len(self.docs), stats=self.stats)]
+
+    def add(self, docs: List[dict]) -> int:
+        """
+        Adds new problem/solution pairs (`description`, `code` and optionally the sample tests)
+        as an incremental segment, without reindexing the main corpus. Returns the number added.
+        """
+        rows = [row for row in map(prepare_doc, docs) if row is not None]
+        if not rows:
+            return 0
+        with self._segments_lock:
+            self.segments = self.segments + [Segment(rows, offset=len(self), stats=self.stats)]
+            if self.segments_path is not None:
+                self.segments_path.parent.mkdir(parents=True, exist_ok=True)
+                pd.DataFrame(rows).to_json(
+                    self.segments_path, orient="records", lines=True, mode="a"
+                )
+            should_merge = len(self.segments) > self.max_segments and (
+                self._merge_thread is None or not self._merge_thread.is_alive()
+            )
+            if should_merge:
+                self._merge_thread = threading.Thread(
+                    target=self.merge_segments, daemon=True
+                )
+                self._merge_thread.start()
+        logger.info(f"Added {len(rows)} docs in segment {len(self.segments)}")
+        return len(rows)
+
+    def merge_segments(self):
+        """Merges the incremental segments into one, keeping any added while merging."""
+        with self._segments_lock:
+            segments = self.segments
+        merged = Segment(
+            [row for segment in segments for row in segment.rows],
+            offset=segments[0].offset,
+            stats=self.stats,
+        )
+        with self._segments_lock:
+            self.segments = [merged] + self.segments[len(segments) :]
+        logger.info(f"Merged {len(segments)} segments into {len(merged)} docs")
+
+    def take(self, doc_ids: Sequence[int]) -> List[dict]:
+        """Materializes docs by id from the main store or the segment that holds them."""
+        segments = self.segments
+        docs = []
+        for doc_id in doc_ids:
+            doc_id = int(doc_id)
+            if doc_id < len(self.docs):
+                docs.extend(self.docs.take([doc_id]))
+                continue
+            for segment in segments:
+                if segment.offset <= doc_id < segment.offset + len(segment):
+                    docs.extend(segment.docs.take([doc_id - segment.offset]))
+                    break
+        return docs
+
+    def search(self, query_tokens, k: int, n_threads: int = 0) -> List[List[int]]:
+        """BM25 doc ids per query, merging the main index with every incremental segment by score."""
+        indices, scores = self.retriever.retrieve(
+            query_tokens, k=k, n_threads=n_threads, show_progress=False
+        )
+        segments = self.segments
+        if not segments:
+            return [row.tolist() for row in indices]
+
+        candidates = [list(zip(row_scores, row)) for row, row_scores in zip(indices, scores)]
+        for segment in segments:
+            segment_indices, segment_scores = segment.index.retrieve(
+                query_tokens, k=min(k, len(segment)), show_progress=False
+            )
+            for row, row_indices, row_scores in zip(
+                candidates, segment_indices, segment_scores
+            ):
+                row.extend(zip(row_scores, row_indices + segment.offset))
+        # segments are scored with the main corpus statistics, so their scores sort together
+        return [
+            [int(doc_id) for _, doc_id in sorted(row, key=lambda x: -x[0])[:k]]
+            for row in candidates
+        ]
+
+    def load_dense_index(self, path: Path) -> IVFIndex:
+        embeddings = load_corpus_embeddings(Path(CORPUS_EMBEDDINGS), len(self.docs))
+        if embeddings is None:
+            raise FileNotFoundError(
+                f"Hybrid retrieval needs corpus embeddings at {CORPUS_EMBEDDINGS}, run embeddings.py first"
+            )
+        if path.exists():
+            return IVFIndex.load(path, embeddings)
+        index = IVFIndex.build(embeddings)
+        index.save(path)
+        return index
+
+    def fuse(self, bm25_ids: Sequence[int], dense_query: np.ndarray, k: int) -> List[int]:
+        dense_ids, _ = self.dense_index.search(dense_query, self.fusion_depth, self.n_probe)
+        return reciprocal_rank_fusion([bm25_ids, dense_ids], k)
+
+    @traced_op(level="full")
+    @metrics.timed("retrieve")
+    def retrieve(self, query: str, k: int = 10, dense_query: Optional[str] = None):
+        """
+        Retrieves the top-k docs for a code query. In hybrid mode the BM25 ranking is fused with
+        a dense ranking of `dense_query` (defaults to the code query).
+        """
+        normalized_query = normalize_query(query)
         query_tokens = bm25s.tokenize(normalized_query, stopwords=None)
-        docs, _ = self.retriever.retrieve(query_tokens, k=k, corpus=self.docs)
-        return docs[0, :].tolist()
+        if self.dense_index is None:
+            return self.take(self.search(query_tokens, k)[0])
+
+        doc_ids = self.search(query_tokens, max(k, self.fusion_depth))[0]
+        query_embeddings = load_embedding_model().encode(
+            [dense_query or query], normalize_embeddings=True
+        )
+        return self.take(self.fuse(doc_ids, query_embeddings[0], k))
+
+    @traced_op
+    @metrics.timed("retrieve_many")
+    def retrieve_many(
+        self,
+        queries: List[str],
+        k: int = 10,
+        n_threads: int = -1,
+        dense_queries: Optional[List[str]] = None,
+    ) -> List[List[dict]]:
+        """Retrieves the top-k docs for each query with a single batched BM25 call."""
+        start = time.perf_counter()
+        normalized_queries = normalize_query_list(queries)
+        query_tokens = bm25s.tokenize(normalized_queries, stopwords=None)
+        doc_ids = self.search(
+            query_tokens,
+            k=k if self.dense_index is None else max(k, self.fusion_depth),
+            n_threads=n_threads,
+        )
+        if self.dense_index is None:
+            results = [self.take(row) for row in doc_ids]
+        else:
+            query_embeddings = load_embedding_model().encode(
+                dense_queries or queries, normalize_embeddings=True
+            )
+            results = [
+                self.take(self.fuse(row, query_embedding, k))
+                for row, query_embedding in zip(doc_ids, query_embeddings)
+            ]
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Retrieved {len(queries)} queries in {elapsed:.2f}s "
+            f"({len(queries) / max(elapsed, 1e-9):.1f} queries/s)"
+        )
+        return results
 
 
 def index_data(
@@ -220,32 +684,55 @@ def index_data(
 
 
 class RerankModel:
-    def __init__(self):
-        self.model = SentenceTransformer(
-            "jinaai/jina-embeddings-v2-base-code", trust_remote_code=True
+    def __init__(self, embeddings_path: Path = Path(CORPUS_EMBEDDINGS)):
+        self.model = load_embedding_model()
+        self.embeddings_path = embeddings_path
+        # precomputed by `embeddings.py`, loaded by `load_corpus` once the doc store is known
+        self.corpus_embeddings: Optional[np.ndarray] = None
+
+    def load_corpus(self, num_docs: int):
+        """Uses the precomputed embeddings of a `num_docs` doc store, raising if they don't align."""
+        self.corpus_embeddings = load_corpus_embeddings(self.embeddings_path, num_docs)
+
+    def embed_docs(self, docs: List[dict]) -> np.ndarray:
+        """Gathers precomputed embeddings by doc id and only encodes docs that don't have one."""
+        num_precomputed = (
+            0 if self.corpus_embeddings is None else len(self.corpus_embeddings)
         )
+        precomputed, missing = [], []
+        for i, doc in enumerate(docs):
+            doc_id = doc.get("doc_id")
+            if doc_id is not None and doc_id < num_precomputed:
+                precomputed.append(i)
+            else:
+                missing.append(i)
+
+        embeddings = np.empty(
+            (len(docs), self.model.get_sentence_embedding_dimension()), dtype=np.float32
+        )
+        if precomputed:
+            embeddings[precomputed] = self.corpus_embeddings[
+                [docs[i]["doc_id"] for i in precomputed]
+            ]
+        if missing:
+            embeddings[missing] = self.model.encode(
+                [doc_text(docs[i]) for i in missing],
+                batch_size=2,
+                normalize_embeddings=True,
+            )
+        return embeddings
 
-        # control your input sequence length up to 8192
-        self.model.max_seq_length = 1024
-
-    @weave.op
-    def __call__(
+    def rank(
         self,
-        problem: Problem,
-        solution: Solution,
         retrieved_docs: List[dict],
+        context_embeddings: np.ndarray,
+        query_embedding: np.ndarray,
         top_k: int = 3,
-    ):
-        query_text = problem.problem_description + " " + solution.source_code
-        context_text = [
-            doc["description"] + " " + doc["code"] for doc in retrieved_docs
-        ]
-
-        query_embeddings = self.model.encode([query_text])
-        context_embeddings = self.model.encode(context_text, batch_size=2)
-        similarities = cos_sim(query_embeddings, context_embeddings)
+    ) -> List[dict]:
+        # embeddings are normalized, so the dot product is the cosine similarity
+        similarities = context_embeddings @ query_embedding
         docs_df = pd.DataFrame(retrieved_docs)
-        docs_df["similarity"] = similarities[0]
+        docs_df["similarity"] = similarities
         docs_df = docs_df.sort_values(by="similarity", ascending=False)
         docs_df = docs_df.drop_duplicates(
             subset=["description"],
@@ -253,18 +740,152 @@ class RerankModel:
         )
         return docs_df.head(top_k).to_dict(orient="records")
 
+    def rerank_batch(self, requests: List[tuple]) -> List[List[dict]]:
+        """
+        Reranks several `(problem, solution, retrieved_docs, top_k)` requests with one query
+        encoding pass and one doc embedding pass.
+        """
+        query_texts = [
+            problem.problem_description + " " + solution.source_code
+            for problem, solution, _, _ in requests
+        ]
+        query_embeddings = self.model.encode(query_texts, normalize_embeddings=True)
+        all_docs = [doc for _, _, retrieved_docs, _ in requests for doc in retrieved_docs]
+        all_embeddings = self.embed_docs(all_docs) if all_docs else None
+
+        results, offset = [], 0
+        for (_, _, retrieved_docs, top_k), query_embedding in zip(
+            requests, query_embeddings
+        ):
+            if not retrieved_docs:
+                results.append([])
+                continue
+            context_embeddings = all_embeddings[offset : offset + len(retrieved_docs)]
+            offset += len(retrieved_docs)
+            results.append(
+                self.rank(retrieved_docs, context_embeddings, query_embedding, top_k)
+            )
+        return results
+
+    @traced_op(level="full")
+    def __call__(
+        self,
+        problem: Problem,
+        solution: Solution,
+        retrieved_docs: List[dict],
+        top_k: int = 3,
+    ):
+        return self.rerank_batch([(problem, solution, retrieved_docs, top_k)])[0]
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Optional[Exception] = None):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class RerankService:
+    """
+    Runs reranking on a dedicated worker thread so encoding never blocks the event loop.
+    Concurrent requests are gathered into batches of up to `max_batch_size`, waiting at most
+    `max_wait` seconds for more to arrive, and each request's future resolves on its own loop.
+    """
+
+    def __init__(
+        self, model: RerankModel, max_batch_size: int = 8, max_wait: float = 0.02
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    async def rerank(
+        self,
+        problem: Problem,
+        solution: Solution,
+        retrieved_docs: List[dict],
+        top_k: int = 3,
+    ) -> List[dict]:
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests.put(
+            (loop, future, (problem, solution, retrieved_docs, top_k), time.perf_counter())
+        )
+        return await future
+
+    def next_batch(self) -> List[tuple]:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self.next_batch()
+            started = time.perf_counter()
+            for *_, enqueued in batch:
+                metrics.observe("queue_wait_seconds", started - enqueued, queue="rerank")
+            metrics.observe("batch_size", len(batch), queue="rerank")
+            try:
+                with metrics.timer("rerank_batch"):
+                    results = self.model.rerank_batch([request for _, _, request, _ in batch])
+            except Exception as e:
+                logger.error(f"Reranking a batch of {len(batch)} requests failed: {e}")
+                for loop, future, _, _ in batch:
+                    self.deliver(loop, future, None, e)
+                continue
+            for (loop, future, _, _), result in zip(batch, results):
+                self.deliver(loop, future, result)
+
+    @staticmethod
+    def deliver(
+        loop: asyncio.AbstractEventLoop,
+        future: asyncio.Future,
+        result: Any = None,
+        error: Optional[Exception] = None,
+    ):
+        try:
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+        except RuntimeError:
+            # the requesting loop closed while the batch ran, so nobody awaits this future
+            # anymore; drop it rather than letting the worker thread die
+            logger.warning("Dropping a rerank result for a closed event loop")
+
 
 rerank_model = RerankModel()
+rerank_service = RerankService(
+    rerank_model, max_batch_size=RERANK_MAX_BATCH_SIZE, max_wait=RERANK_MAX_WAIT
+)
 
 
-@weave.op
+@traced_op
+@metrics.timed("rerank_docs")
 async def rerank_docs(
     problem: Problem,
     solution: Solution,
     retrieved_docs: List[dict],
     top_k: int = 3,
 ) -> List[dict]:
-    return rerank_model(problem, solution, retrieved_docs, top_k)
+    return await rerank_service.rerank(problem, solution, retrieved_docs, top_k)
 
 
 if __name__ == "__main__":
@@ -272,6 +893,10 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("-c", "--cache-directory", type=Path, default="data/cache")
     parser.add_argument("--reload-cache", action="store_true")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85)
+    parser.add_argument("--max-per-problem", type=int, default=10)
+    parser.add_argument("--shard-size", type=int, default=CORPUS_SHARD_SIZE)
+    parser.add_argument("--num-workers", type=int, default=CORPUS_WORKERS)
 
     args = parser.parse_args()
 
@@ -285,18 +910,23 @@ if __name__ == "__main__":
             args.cache_directory / "raw.jsonl",
             args.cache_directory / "preprocessed.jsonl",
             args.reload_cache,
+            args.dedup_threshold,
+            args.max_per_problem,
         )
         retriever = Retriever(data_df=preprocessed_df)
         retriever.index()
         retriever.save(args.cache_directory / "retriever")
     else:
-        raw_df = get_code_contests_data(
-            args.cache_directory / "raw.jsonl", args.reload_cache
-        )
+        if args.reload_cache or not (args.cache_directory / "raw.jsonl").exists():
+            build_code_contests_corpus(
+                args.cache_directory / "raw.jsonl", args.shard_size, args.num_workers
+            )
         preprocessed_df = preprocess_data(
             args.cache_directory / "raw.jsonl",
             args.cache_directory / "preprocessed.jsonl",
             args.reload_cache,
+            args.dedup_threshold,
+            args.max_per_problem,
         )
         retriever = Retriever(data_df=preprocessed_df)
         retriever.index()
@@ -0,0 +1,160 @@
+import hashlib
+import inspect
+import json
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from metrics import metrics
+from utils import Analysis, Problem, Reflection, Solution, TestReport
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    # keying an object by instance would give it a new key every run, so a checkpoint could
+    # never be resumed
+    raise TypeError(
+        f"Can't key a stage input of type {type(value).__name__}, pass its content instead"
+    )
+
+
+def stage_key(*args, **kwargs) -> str:
+    payload = json.dumps([_canonical(list(args)), _canonical(kwargs)], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# models that can be restored from a stage checkpoint
+CHECKPOINT_MODELS = {
+    model.__name__: model for model in (Analysis, Problem, Reflection, Solution, TestReport)
+}
+
+
+def encode_output(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return {"__model__": type(value).__name__, "data": value.model_dump(mode="json")}
+    if isinstance(value, dict):
+        return {str(key): encode_output(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_output(item) for item in value]
+    return value
+
+
+def decode_output(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__model__" in value:
+            return CHECKPOINT_MODELS[value["__model__"]](**value["data"])
+        return {key: decode_output(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_output(item) for item in value]
+    return value
+
+
+@dataclass
+class StageStats:
+    computed: int = 0
+    skipped: int = 0
+    time_spent: float = 0.0
+    time_saved: float = 0.0
+
+
+class StageCache:
+    """
+    Memoizes the outputs of pipeline stages by a hash of their inputs, so later iterations of a
+    solver only recompute the stages whose inputs changed. Stochastic stages that should be
+    resampled every iteration pass the iteration as `salt`.
+
+    With a `path`, every computed output is also appended to a JSONL checkpoint and restored
+    from it on construction, so an interrupted run resumes without repeating finished stages.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.outputs: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self.stats: Dict[str, StageStats] = {}
+        self.path = path
+        if path is not None and path.exists():
+            with path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a write cut short by a crash
+                        continue
+                    self.outputs[(record["stage"], record["key"])] = (
+                        decode_output(record["output"]),
+                        record["duration"],
+                    )
+            logger.info(f"Restored {len(self.outputs)} stage outputs from {path}")
+
+    async def run(self, stage: str, fn: Callable, *args, salt: Any = None, **kwargs) -> Any:
+        key = (stage, stage_key(*args, salt=salt, **kwargs))
+        stats = self.stats.setdefault(stage, StageStats())
+        if key in self.outputs:
+            output, duration = self.outputs[key]
+            stats.skipped += 1
+            stats.time_saved += duration
+            metrics.inc("cache_lookups", cache="stage", stage=stage, result="hit")
+            return output
+
+        start = time.perf_counter()
+        output = fn(*args, **kwargs)
+        if inspect.isawaitable(output):
+            output = await output
+        duration = time.perf_counter() - start
+        metrics.inc("cache_lookups", cache="stage", stage=stage, result="miss")
+        metrics.observe("pipeline_stage_seconds", duration, stage=stage)
+        self.outputs[key] = (output, duration)
+        self.checkpoint(key, output, duration)
+        stats.computed += 1
+        stats.time_spent += duration
+        return output
+
+    def checkpoint(self, key: Tuple[str, str], output: Any, duration: float):
+        if self.path is None:
+            return
+        record = {
+            "stage": key[0],
+            "key": key[1],
+            "output": encode_output(output),
+            "duration": duration,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    def report(self) -> dict:
+        return {
+            stage: {
+                "computed": stats.computed,
+                "skipped": stats.skipped,
+                "time_spent": round(stats.time_spent, 3),
+                "time_saved": round(stats.time_saved, 3),
+            }
+            for stage, stats in self.stats.items()
+        }
+
+    def log_report(self):
+        for stage, stats in self.report().items():
+            logger.info(
+                f"Stage {stage}: computed {stats['computed']}, skipped {stats['skipped']}, "
+                f"spent {stats['time_spent']}s, saved {stats['time_saved']}s"
+            )
+        total_saved = sum(stats.time_saved for stats in self.stats.values())
+        logger.info(f"Stage cache saved {total_saved:.1f}s in total")
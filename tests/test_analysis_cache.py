@@ -0,0 +1,33 @@
+from analysis_cache import AnalysisCache
+from utils import Analysis
+
+DOC = {"description": "Sum two numbers.", "code": "print(sum(map(int, input().split())))"}
+ANALYSIS = Analysis(
+    core_question="sum",
+    problem_solving_info=[],
+    algorithm="addition",
+    tutorial="",
+    plan="",
+    pseudocode="",
+)
+
+
+def test_analyses_persist_across_instances(tmp_path):
+    path = tmp_path / "analyses.jsonl"
+    AnalysisCache(path).put(DOC, ANALYSIS)
+
+    cache = AnalysisCache(path)
+    assert DOC in cache
+    assert cache.get(DOC) == ANALYSIS
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "analyses.jsonl"
+    AnalysisCache(path).put(DOC, ANALYSIS)
+    # a process killed while appending leaves half a record behind
+    with path.open("a") as f:
+        f.write('{"key": "abc", "analysis": {"core_qu')
+
+    cache = AnalysisCache(path)
+    assert len(cache) == 1
+    assert cache.get(DOC) == ANALYSIS
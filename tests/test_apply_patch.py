@@ -0,0 +1,113 @@
+import pytest
+
+from utils import PatchError, apply_patch, parse_hunks
+
+CODE = """import sys
+
+
+def solve(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def main():
+    n = int(sys.stdin.readline())
+    print(solve(n))
+
+
+main()"""
+
+
+def test_single_hunk():
+    patch = """--- a/solution.py
++++ b/solution.py
+@@ -6,2 +6,2 @@
+     for i in range(n):
+-        total += i
++        total += i * i
+"""
+    assert "total += i * i" in apply_patch(CODE, patch)
+    assert "total += i\n" not in apply_patch(CODE, patch)
+
+
+def test_fenced_diff():
+    patch = """Here is the fix:
+```diff
+@@ -7 +7 @@
+-        total += i
++        total -= i
+```
+"""
+    assert "total -= i" in apply_patch(CODE, patch)
+
+
+def test_wrong_line_numbers_locate_the_hunk_by_context():
+    patch = """@@ -40,3 +40,3 @@
+ def main():
+-    n = int(sys.stdin.readline())
++    n = int(input())
+     print(solve(n))
+"""
+    patched = apply_patch(CODE, patch)
+    assert "n = int(input())" in patched
+    assert "sys.stdin.readline" not in patched
+
+
+def test_blank_context_lines_without_leading_space():
+    patch = """@@ -8,5 +8,5 @@
+     return total
+
+-
++# entry point
+ def main():
+"""
+    # the blank line between `return total` and the removed line lost its leading space
+    hunks = parse_hunks(patch)
+    assert hunks[0][1][1] == " "
+    assert "# entry point\ndef main():" in apply_patch(CODE, patch)
+
+
+def test_multiple_hunks_track_the_line_offset():
+    patch = """@@ -1 +1,2 @@
+ import sys
++import math
+@@ -7 +8,2 @@
+-        total += i
++        if i % 2:
++            total += i
+"""
+    patched = apply_patch(CODE, patch)
+    assert patched.startswith("import sys\nimport math\n")
+    assert "        if i % 2:\n            total += i\n" in patched
+
+
+def test_pure_insertion():
+    patch = """@@ -16,0 +17 @@
++sys.exit(0)
+"""
+    assert apply_patch(CODE, patch).endswith("main()\nsys.exit(0)")
+
+
+def test_no_diff_is_rejected():
+    with pytest.raises(PatchError, match="no hunks"):
+        apply_patch(CODE, "I rewrote the loop to be faster.")
+
+
+def test_context_that_does_not_match_is_rejected():
+    patch = """@@ -6 +6 @@
+-    while True:
++    while False:
+"""
+    with pytest.raises(PatchError, match="does not match"):
+        apply_patch(CODE, patch)
+
+
+def test_non_compiling_result_is_rejected():
+    patch = """@@ -4 +4 @@
+-def solve(n):
++def solve(n)
+"""
+    with pytest.raises(PatchError, match="does not compile"):
+        apply_patch(CODE, patch)
@@ -0,0 +1,99 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+import beam_search
+from utils import Problem, Solution, TestReport
+
+PROBLEM = Problem(
+    problem_dir=Path("."),
+    problem_name="toy",
+    problem_description="Print pass.",
+    sample_input="",
+    sample_output="pass\n",
+    problem_input=Path("toy.in"),
+    problem_output=Path("toy.out"),
+)
+
+
+def solution(source_code: str) -> Solution:
+    return Solution(
+        core_question="",
+        problem_solving_info=[],
+        algorithm="",
+        tutorial="",
+        plan="",
+        pseudocode="",
+        source_code=source_code,
+    )
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Stub LLM and sandbox calls: improvements come from `outcomes`, one per call."""
+    state = {"outcomes": [], "improved": 0, "cancelled": 0, "drafts": []}
+
+    async def draft_solution(**kwargs):
+        outcome = state["drafts"].pop(0) if state["drafts"] else "fail"
+        if outcome == "raise":
+            raise ValueError("draft failed")
+        return solution(outcome)
+
+    async def reflection(**kwargs):
+        return "reflection"
+
+    async def improve_solution(**kwargs):
+        outcome = state["outcomes"][state["improved"]]
+        state["improved"] += 1
+        try:
+            await asyncio.sleep(0.01 if outcome in ("pass", "raise") else 1.0)
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        if outcome == "raise":
+            raise ValueError("improve failed")
+        return solution(outcome)
+
+    async def check_correctness(source_code, *args):
+        return TestReport(status="passed" if source_code == "pass" else "failed", message="")
+
+    monkeypatch.setattr(beam_search, "draft_solution", draft_solution)
+    monkeypatch.setattr(beam_search, "reflection", reflection)
+    monkeypatch.setattr(beam_search, "improve_solution", improve_solution)
+    monkeypatch.setattr(beam_search, "check_correctness", check_correctness)
+    return state
+
+
+def test_search_stops_and_reaps_children_once_one_passes(agent):
+    agent["outcomes"] = ["fail", "pass", "fail", "fail"]
+    search = beam_search.BeamSearch(beam_width=2, num_children=2)
+
+    best = asyncio.run(search.search(PROBLEM))
+
+    assert best.passed and best.depth == 1
+    # every slow sibling was cancelled and awaited, not left running
+    assert agent["cancelled"] == agent["improved"] - 1
+
+
+def test_failing_candidates_are_dropped(agent):
+    agent["drafts"] = ["raise", "fail"]
+    agent["outcomes"] = ["raise", "pass"]
+    search = beam_search.BeamSearch(beam_width=2, num_children=2)
+
+    best = asyncio.run(search.search(PROBLEM))
+
+    assert best.passed
+
+
+def test_search_without_candidates_raises(agent):
+    agent["drafts"] = ["raise", "raise"]
+    search = beam_search.BeamSearch(beam_width=2)
+
+    with pytest.raises(RuntimeError, match="no candidate"):
+        asyncio.run(search.search(PROBLEM))
+
+    with pytest.raises(RuntimeError, match="no candidate"):
+        asyncio.run(beam_search.BeamSearch(max_candidates=0).search(PROBLEM))
@@ -0,0 +1,27 @@
+from llm_server import Cassette, request_key
+
+REQUEST = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def test_recordings_replay_in_order(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    key = request_key(REQUEST)
+    cassette = Cassette(path)
+    cassette.record(key, REQUEST, {"id": "first"})
+    cassette.record(key, REQUEST, {"id": "second"})
+
+    replayed = Cassette(path)
+    assert [replayed.replay(key)["id"] for _ in range(3)] == ["first", "second", "first"]
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    key = request_key(REQUEST)
+    Cassette(path).record(key, REQUEST, {"id": "first"})
+    # a server killed while appending leaves half a recording behind
+    with path.open("a") as f:
+        f.write('{"key": "abc", "request": {"mod')
+
+    cassette = Cassette(path)
+    assert key in cassette
+    assert cassette.replay(key) == {"id": "first"}
@@ -0,0 +1,44 @@
+import asyncio
+
+from utils import compare_cases, exec_program
+
+EXPECTED = "Case #1: 3\nCase #2: 5\nCase #3: 7\n"
+
+
+def run(output: str):
+    program = f"print({output!r}, end='')"
+    return asyncio.run(exec_program(program, "", EXPECTED, timeout=10))
+
+
+def test_exact_output_gets_full_credit():
+    report = run(EXPECTED)
+    assert report.status == "passed"
+    assert report.comparison.passed
+    assert report.partial_credit == 1.0
+
+
+def test_reordered_cases_get_less_than_full_credit():
+    report = run("Case #2: 5\nCase #1: 3\nCase #3: 7\n")
+    assert report.status == "failed"
+    assert not report.comparison.passed
+    assert report.comparison.passed_cases == 3
+    assert report.partial_credit < 1.0
+
+
+def test_blank_line_between_cases_gets_less_than_full_credit():
+    report = run("Case #1: 3\n\nCase #2: 5\nCase #3: 7\n")
+    assert report.status == "failed"
+    assert not report.comparison.passed
+    assert report.partial_credit < 1.0
+
+
+def test_failing_output_ranks_below_passing_output():
+    reordered = run("Case #2: 5\nCase #1: 3\nCase #3: 7\n")
+    one_wrong = run("Case #1: 3\nCase #2: 5\nCase #3: 8\n")
+    assert run(EXPECTED).partial_credit > reordered.partial_credit > one_wrong.partial_credit
+
+
+def test_comparison_without_output():
+    comparison = compare_cases(EXPECTED, "")
+    assert comparison.cases == [False, False, False]
+    assert comparison.format_errors == 0
@@ -0,0 +1,46 @@
+import pytest
+
+from evaluation import pass_at_k, trial_statistics
+
+
+@pytest.mark.parametrize(
+    "n, c, k, expected",
+    [
+        (5, 2, 1, 0.4),
+        (5, 2, 2, 0.7),
+        (5, 0, 3, 0.0),
+        (5, 4, 2, 1.0),
+        (3, 3, 1, 1.0),
+    ],
+)
+def test_pass_at_k(n, c, k, expected):
+    assert pass_at_k(n, c, k) == pytest.approx(expected)
+
+
+def record(problem_name: str, trial: int, passed: bool) -> dict:
+    return {"problem_name": problem_name, "trial": trial, "passed": passed}
+
+
+def test_trial_statistics():
+    records = [
+        record("a", 0, True),
+        record("a", 1, True),
+        record("a", 2, False),
+        record("b", 0, False),
+        # trial 1 of b is missing and counts as failed
+        record("b", 2, True),
+    ]
+    stats = trial_statistics(records, trials=3, required_passes=2)
+
+    assert stats["problems"] == 2
+    assert stats["pass_at_k"][1] == pytest.approx((2 / 3 + 1 / 3) / 2)
+    assert stats["pass_at_k"][2] == pytest.approx((1.0 + 2 / 3) / 2)
+    assert stats["pass_at_k"][3] == pytest.approx(1.0)
+    assert stats["solved_2_of_3"] == 1
+    assert stats["per_problem"] == {
+        "a": {"passes": 2, "solved": True},
+        "b": {"passes": 1, "solved": False},
+    }
+    assert stats["solve_rate_per_trial"] == [0.5, 0.5, 0.5]
+    assert stats["solve_rate_stdev"] == 0.0
+    assert stats["flakiness"] == pytest.approx(2 / 9)
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+import retriever
+from retriever import code_hash, normalize_code, normalize_code_list
+
+
+def test_cache_evicts_oldest_entries_beyond_its_size(monkeypatch):
+    monkeypatch.setattr(retriever, "NORMALIZE_CACHE_SIZE", 3)
+    monkeypatch.setattr(retriever, "_normalize_cache", retriever.OrderedDict())
+    codes = [f"x = {i}" for i in range(5)]
+
+    assert normalize_code_list(codes) == [normalize_code(code) for code in codes]
+    assert list(retriever._normalize_cache) == [code_hash(code) for code in codes[2:]]
@@ -0,0 +1,80 @@
+import pytest
+import tiktoken
+
+import utils
+from utils import Analysis, count_tokens, pack_examples, truncate_tokens
+
+GPT2_PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+MERGES = [
+    b"  ", b"    ", b"in", b"pr", b"int", b"print", b"\n\n", b" t", b"th", b" th", b"de", b"def"
+]
+
+
+def toy_encoding() -> tiktoken.Encoding:
+    """A small byte-level BPE, so the tiktoken path runs without downloading an encoding."""
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in MERGES:
+        ranks[merge] = len(ranks)
+    return tiktoken.Encoding("toy", pat_str=GPT2_PATTERN, mergeable_ranks=ranks, special_tokens={})
+
+
+@pytest.fixture(params=["chars", "toy_bpe", "cl100k_base"])
+def tokenizer(request, monkeypatch):
+    if request.param == "chars":
+        encoding = None
+    elif request.param == "toy_bpe":
+        encoding = toy_encoding()
+    else:
+        try:
+            encoding = tiktoken.get_encoding(request.param)
+        except Exception:
+            pytest.skip(f"{request.param} is not available offline")
+    monkeypatch.setattr(utils, "get_tokenizer", lambda: encoding)
+    return encoding
+
+
+def words(n: int, word: str = "the value") -> str:
+    return " ".join([word] * n)
+
+
+EXAMPLES = [
+    {"description": words(1000, f"problem{i}"), "code": f"def solve():\n    print({i})\n" * 20}
+    for i in range(5)
+]
+ANALYSES = [
+    Analysis(
+        core_question=words(30),
+        problem_solving_info=[words(10), words(10)],
+        algorithm=f"algorithm {i}: " + words(20),
+        tutorial=words(500),
+        plan=words(80),
+        pseudocode=words(60),
+    )
+    for i in range(5)
+]
+
+
+@pytest.mark.parametrize("token_budget", [300, 1500, 4000, 8000, 20000])
+def test_packed_prompt_stays_within_budget(tokenizer, token_budget):
+    assert count_tokens(pack_examples(EXAMPLES, ANALYSES, token_budget)) <= token_budget
+
+
+def test_higher_ranked_content_survives_a_tight_budget(tokenizer):
+    packed = pack_examples(EXAMPLES, ANALYSES, 3000)
+
+    # exemplars are kept in rank order, with their statements truncated
+    assert "problem0" in packed
+    assert packed.index("problem0") < packed.index("problem1")
+    assert "[...truncated]" in packed
+    assert EXAMPLES[0]["code"].strip() in packed
+    # the most useful analysis field makes it in before the least useful one
+    assert "<algorithm>" in packed
+    assert "<tutorial>" not in packed
+
+
+def test_truncate_tokens_marks_cut_text(tokenizer):
+    text = words(200)
+    assert truncate_tokens(text, count_tokens(text)) == text
+    truncated = truncate_tokens(text, 50)
+    assert truncated.endswith("[...truncated]")
+    assert count_tokens(truncated) < count_tokens(text)
@@ -0,0 +1,68 @@
+import threading
+
+import pyarrow as pa
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from doc_store import DocStore
+from retriever import Retriever, normalize_code
+
+QUERY = """
+class Solver:
+    def solve(self, n):
+        while n > 1:
+            n = n // 2 if n % 2 == 0 else 3 * n + 1
+        return n
+"""
+
+CORPUS = [
+    # programs sharing parts of the query's structure, but none all of it
+    "class Point:\n    def norm(self, x):\n        return x\n",
+    "def twice(n):\n    return n * 2 + 1\n",
+    "n = 10\nwhile n > 0:\n    n = n - 1\n",
+    "n = int(input())\nfor i in range(n):\n    print(i * i)\n",
+    "s = input()\nif s == s[::-1]:\n    print('YES')\nelse:\n    print('NO')\n",
+]
+
+
+def make_retriever(codes):
+    """A Retriever over an in-memory corpus, skipping the dataset download and dense index."""
+    rows = [
+        {
+            "description": f"problem {i}",
+            "code": code,
+            "sample_inputs": "",
+            "sample_outputs": "",
+            "normalized_code": normalize_code(code),
+        }
+        for i, code in enumerate(codes)
+    ]
+    retriever = Retriever.__new__(Retriever)
+    retriever.docs = DocStore.from_table(pa.Table.from_pylist(rows))
+    retriever.retriever = retriever.index()
+    retriever.dense_index = None
+    retriever.segments = []
+    retriever.segments_path = None
+    retriever.max_segments = 4
+    retriever._segments_lock = threading.Lock()
+    retriever._merge_thread = None
+    return retriever
+
+
+def test_added_solution_outranks_partial_matches_in_the_corpus():
+    retriever = make_retriever(CORPUS * 10)
+    assert retriever.add([{"description": "collatz", "code": QUERY}]) == 1
+
+    docs = retriever.retrieve(QUERY, k=3)
+    assert docs[0]["description"] == "collatz"
+    assert docs[0]["doc_id"] == len(CORPUS) * 10
+
+
+def test_segment_scores_match_the_main_index():
+    # the same doc scores (nearly) the same whether it was indexed up front or added later
+    retriever = make_retriever(CORPUS * 10 + [QUERY])
+    retriever.add([{"description": "collatz again", "code": QUERY}])
+
+    docs = retriever.retrieve(QUERY, k=2)
+    assert {doc["doc_id"] for doc in docs} == {len(CORPUS) * 10, len(CORPUS) * 10 + 1}
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from stages import StageCache, stage_key
+import utils
+
+
+def counting(fn):
+    calls = []
+
+    async def wrapper(*args, **kwargs):
+        calls.append((args, kwargs))
+        return fn(*args, **kwargs)
+
+    wrapper.calls = calls
+    return wrapper
+
+
+def test_checkpointed_run_resumes_without_recomputing(tmp_path):
+    path = tmp_path / "stages.jsonl"
+    check = counting(
+        lambda code, timeout: utils.TestReport(status="passed", message=code, runtime=0.5)
+    )
+
+    first = StageCache(path)
+    report = asyncio.run(first.run("test", check, "print(1)", timeout=10))
+    assert len(check.calls) == 1
+
+    resumed = StageCache(path)
+    restored = asyncio.run(resumed.run("test", check, "print(1)", timeout=10))
+    assert len(check.calls) == 1
+    assert restored == report
+    assert resumed.report()["test"] == {
+        "computed": 0,
+        "skipped": 1,
+        "time_spent": 0.0,
+        "time_saved": round(first.stats["test"].time_spent, 3),
+    }
+
+
+def test_changed_inputs_and_salt_recompute(tmp_path):
+    stages = StageCache(tmp_path / "stages.jsonl")
+    generate = counting(lambda prompt: prompt.upper())
+
+    asyncio.run(stages.run("generate", generate, "a"))
+    asyncio.run(stages.run("generate", generate, "a"))
+    asyncio.run(stages.run("generate", generate, "b"))
+    asyncio.run(stages.run("generate", generate, "a", salt=1))
+    assert [args for args, _ in generate.calls] == [("a",), ("b",), ("a",)]
+
+
+def test_truncated_checkpoint_line_is_skipped(tmp_path):
+    path = tmp_path / "stages.jsonl"
+    double = counting(lambda x: 2 * x)
+    asyncio.run(StageCache(path).run("double", double, 2))
+    with path.open("a") as f:
+        f.write('{"stage": "double", "key": "ab')
+
+    assert asyncio.run(StageCache(path).run("double", double, 2)) == 4
+    assert len(double.calls) == 1
+
+
+def test_stage_keys_are_stable_across_runs():
+    report = utils.TestReport(status="failed", message="")
+    assert stage_key(report, np.int64(3), k=[1, 2]) == stage_key(report, 3, k=[1, 2])
+
+
+def test_unkeyable_input_raises():
+    with pytest.raises(TypeError, match="lock"):
+        stage_key(threading.Lock())
@@ -0,0 +1,194 @@
+import contextvars
+import functools
+import hashlib
+import inspect
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Type
+
+import weave
+from pydantic import BaseModel
+from weave.trace.client_context import weave_client as weave_client_context
+
+# "off" wraps nothing, "stages" only pipeline stages and LLM calls, "full" also the small helpers
+# and is meant for debugging a single run
+TRACING_LEVELS = {"off": 0, "stages": 1, "full": 2}
+TRACE_LEVEL = os.getenv("TRACE_LEVEL", "stages")
+if TRACE_LEVEL not in TRACING_LEVELS:
+    raise ValueError(f"TRACE_LEVEL must be one of {list(TRACING_LEVELS)}, got {TRACE_LEVEL!r}")
+
+# trace capture policy, see `CapturePolicy`
+TRACE_MAX_CHARS = int(os.getenv("TRACE_MAX_CHARS", 4096))
+TRACE_PREVIEW_CHARS = int(os.getenv("TRACE_PREVIEW_CHARS", 200))
+TRACE_HASH_CHARS = int(os.getenv("TRACE_HASH_CHARS", 65536))
+TRACE_MAX_ITEMS = int(os.getenv("TRACE_MAX_ITEMS", 50))
+
+
+@dataclass(frozen=True)
+class CapturePolicy:
+    """
+    How op inputs and outputs are recorded in traces. Strings and bytes longer than `max_chars`
+    are replaced by their size, a digest and a `preview_chars` preview, paths are recorded by
+    reference without being read and sequences are cut to `max_items`. The digest covers the
+    whole value up to `hash_chars` and otherwise its size, head and tail, so capture cost doesn't
+    grow with the payload.
+    """
+    max_chars: int = TRACE_MAX_CHARS
+    preview_chars: int = TRACE_PREVIEW_CHARS
+    hash_chars: int = TRACE_HASH_CHARS
+    max_items: int = TRACE_MAX_ITEMS
+
+
+DEFAULT_POLICY = CapturePolicy()
+
+# types recorded as a small reference instead of their fields, see `capture_by_reference`
+_references: Dict[Type, Callable[[Any], dict]] = {}
+
+
+def capture_by_reference(cls: Type, reference: Callable[[Any], dict]):
+    """Records instances of `cls` in traces as `reference(instance)`."""
+    _references[cls] = reference
+
+
+def digest(value, policy: CapturePolicy = DEFAULT_POLICY) -> str:
+    if len(value) > policy.hash_chars:
+        half = policy.hash_chars // 2
+        value = value[:half] + value[-half:]
+        prefix = "sampled:"
+    else:
+        prefix = ""
+    data = value.encode(errors="replace") if isinstance(value, str) else bytes(value)
+    return prefix + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def summarize(value: Any, policy: CapturePolicy = DEFAULT_POLICY) -> Any:
+    """What a trace records for `value`, the value itself when it is already small."""
+    if isinstance(value, (str, bytes, bytearray)):
+        if len(value) <= policy.max_chars:
+            return value
+        preview = value[: policy.preview_chars]
+        if not isinstance(preview, str):
+            preview = bytes(preview).decode(errors="replace")
+        return {"size": len(value), "digest": digest(value, policy), "preview": preview}
+    if isinstance(value, Path):
+        return {"path": str(value)}
+    reference = _references.get(type(value))
+    if reference is not None:
+        return reference(value)
+    if isinstance(value, BaseModel) and not isinstance(value, weave.Object):
+        fields = {name: getattr(value, name) for name in type(value).model_fields}
+        summary = {name: summarize(field, policy) for name, field in fields.items()}
+        if all(summary[name] is fields[name] for name in fields):
+            return value
+        return {"type": type(value).__name__, **summary}
+    if isinstance(value, dict):
+        items = list(value.items())[: policy.max_items]
+        summary = {key: summarize(item, policy) for key, item in items}
+        if len(value) > policy.max_items:
+            summary["..."] = f"{len(value) - policy.max_items} more items"
+        elif all(summary[key] is item for key, item in items):
+            return value
+        return summary
+    if isinstance(value, (list, tuple)):
+        items = value[: policy.max_items]
+        summary = [summarize(item, policy) for item in items]
+        if len(value) > policy.max_items:
+            summary.append(f"... {len(value) - policy.max_items} more items")
+        elif all(s is item for s, item in zip(summary, items)):
+            return value
+        return summary
+    return value
+
+
+def traced_op(
+    fn: Optional[Callable] = None,
+    *,
+    level: str = "stages",
+    policy: CapturePolicy = DEFAULT_POLICY,
+):
+    """
+    `weave.op` that records summarized inputs and outputs (see `summarize`) while the function
+    itself receives and returns the real values. Functions above `TRACE_LEVEL` are returned
+    undecorated, so they cost nothing per call, and without an active weave client the
+    function is called directly.
+    """
+    if fn is None:
+        return functools.partial(traced_op, level=level, policy=policy)
+    if TRACING_LEVELS[level] > TRACING_LEVELS[TRACE_LEVEL]:
+        return fn
+
+    signature = inspect.signature(fn)
+    skip_self = next(iter(signature.parameters), None) == "self"
+    # the real arguments of the call in flight, the op itself only sees their summaries
+    payload: contextvars.ContextVar = contextvars.ContextVar(f"{fn.__qualname__}_payload")
+
+    def summarize_args(args, kwargs):
+        kept = args[:1] if skip_self else ()
+        summarized = tuple(summarize(arg, policy) for arg in args[len(kept):])
+        return kept + summarized, {key: summarize(value, policy) for key, value in kwargs.items()}
+
+    if inspect.iscoroutinefunction(fn):
+
+        @weave.op
+        @functools.wraps(fn)
+        async def op(*_args, **_kwargs):
+            args, kwargs, result = payload.get()
+            result.append(await fn(*args, **kwargs))
+            return summarize(result[0], policy)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if weave_client_context.get_weave_client() is None:
+                return await fn(*args, **kwargs)
+            result = []
+            token = payload.set((args, kwargs, result))
+            try:
+                summary_args, summary_kwargs = summarize_args(args, kwargs)
+                await op(*summary_args, **summary_kwargs)
+            finally:
+                payload.reset(token)
+            return result[0]
+
+    else:
+
+        @weave.op
+        @functools.wraps(fn)
+        def op(*_args, **_kwargs):
+            args, kwargs, result = payload.get()
+            result.append(fn(*args, **kwargs))
+            return summarize(result[0], policy)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if weave_client_context.get_weave_client() is None:
+                return fn(*args, **kwargs)
+            result = []
+            token = payload.set((args, kwargs, result))
+            try:
+                summary_args, summary_kwargs = summarize_args(args, kwargs)
+                op(*summary_args, **summary_kwargs)
+            finally:
+                payload.reset(token)
+            return result[0]
+
+    wrapper.op = op
+    return wrapper
+
+
+class TracedError(Exception):
+    """An error recorded in a trace by `annotate_error`, never raised."""
+
+
+def annotate_error(message: str, name: str = "error"):
+    """
+    Records `message` as a failed child call of the current op, so a handled error shows up in
+    the trace while execution continues.
+    """
+    if TRACE_LEVEL == "off":
+        return
+    client = weave_client_context.get_weave_client()
+    if client is None:
+        return
+    call = client.create_call(name, inputs={"message": message})
+    client.finish_call(call, exception=TracedError(message))
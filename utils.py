@@ -1,4 +1,6 @@
 import asyncio
+import contextlib
+import difflib
 import multiprocessing
 import os
 import pathlib
@@ -10,16 +12,21 @@ import sys
 import logging
 import time
 import traceback
-from typing import Any, List
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 import math
 
-import weave
 import openai
 import instructor
+import tiktoken
+from joblib import Parallel, delayed
 
 from pydantic import BaseModel, Field
 from tree_sitter_languages import get_language, get_parser
 
+from metrics import count_http_attempt, instrument_llm_client, metrics
+from tracing import capture_by_reference, traced_op
+
 
 # API params
 BASE_URL = os.getenv("BASE_URL", None)
@@ -29,9 +36,54 @@ API_KEY = os.getenv("API_KEY", "dummy_key")
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", 4096))
 FAST_LLM = os.getenv("FAST_LLM", "open-mistral-nemo-2407")
 STRONG_LLM = os.getenv("STRONG_LLM", "mistral-large-latest")
+EXEMPLAR_TOKEN_BUDGET = int(os.getenv("EXEMPLAR_TOKEN_BUDGET", 8000))
+EXEMPLAR_TOKENIZER = os.getenv("EXEMPLAR_TOKENIZER", "cl100k_base")
+
+# caps shared by every solver in the process, see `set_concurrency_limits`
+concurrency_limits: Dict[str, Optional[asyncio.Semaphore]] = {"llm": None, "sandbox": None}
+
+
+def set_concurrency_limits(llm: Optional[int] = None, sandbox: Optional[int] = None):
+    """Caps concurrent LLM requests and sandboxed program runs, None leaves them unbounded."""
+    concurrency_limits["llm"] = asyncio.Semaphore(llm) if llm else None
+    concurrency_limits["sandbox"] = asyncio.Semaphore(sandbox) if sandbox else None
+
+
+@contextlib.asynccontextmanager
+async def concurrency_slot(kind: str):
+    semaphore = concurrency_limits[kind]
+    if semaphore is None:
+        yield
+        return
+    start = time.perf_counter()
+    async with semaphore:
+        metrics.observe("queue_wait_seconds", time.perf_counter() - start, queue=kind)
+        yield
+
 
-# API client
-oai_client = openai.AsyncOpenAI(base_url=BASE_URL, api_key=API_KEY)
+def limit_llm_client(client):
+    """Makes `chat.completions.create` wait for an "llm" concurrency slot."""
+    completions = client.chat.completions
+    create = completions.create
+
+    async def limited_create(*args, **kwargs):
+        async with concurrency_slot("llm"):
+            return await create(*args, **kwargs)
+
+    completions.create = limited_create
+    return client
+
+
+# API client, instrumented and limited before instructor captures its `create`
+oai_client = limit_llm_client(
+    instrument_llm_client(
+        openai.AsyncOpenAI(
+            base_url=BASE_URL,
+            api_key=API_KEY,
+            http_client=openai.DefaultAsyncHttpxClient(event_hooks={"response": [count_http_attempt]}),
+        )
+    )
+)
 async_client = instructor.from_openai(oai_client, mode=instructor.Mode.JSON)
 
 language = get_language("python")
@@ -53,40 +105,39 @@ def remove_extra_newlines(text: str) -> str:
     return text
 
 
+# Queries to capture comments and docstrings, compiled once at import
+DOC_STR_QUERY = language.query("""
+(module . (expression_statement (string)) @module_doc_str)
+(class_definition body: (block . (expression_statement (string)) @class_doc_str))
+(function_definition body: (block . (expression_statement (string)) @function_doc_str))
+""")
+COMMENT_QUERY = language.query("(comment) @comment")
+
+
 def remove_comments_and_docstrings(code):
-    # Define queries to capture comments and docstrings
-    doc_str_pattern = """
-    (module . (expression_statement (string)) @module_doc_str)
-    (class_definition body: (block . (expression_statement (string)) @class_doc_str))
-    (function_definition body: (block . (expression_statement (string)) @function_doc_str))
-    """
+    # Without a `#` or a quote there is nothing to strip, so skip the parse
+    if "#" not in code and '"' not in code and "'" not in code:
+        return code
 
-    comment_pattern = "(comment) @comment"
     # Parse the code
     tree = tree_parser.parse(code.encode())
     root_node = tree.root_node
 
-    # Query the tree for docstrings and comments
-    doc_str_query = language.query(doc_str_pattern)
-    doc_strs = doc_str_query.captures(root_node)
-
-    comment_query = language.query(comment_pattern)
-    comments = comment_query.captures(root_node)
-
     # Get the start and end points of all docstrings and comments
-    doc_str_points = set((node.start_byte, node.end_byte) for node, _ in doc_strs)
-    comment_points = set((node.start_byte, node.end_byte) for node, _ in comments)
-
-    # Create a set of all points to remove
-    remove_points = doc_str_points.union(comment_points)
+    remove_points = [
+        (node.start_byte, node.end_byte)
+        for query in (DOC_STR_QUERY, COMMENT_QUERY)
+        for node, _ in query.captures(root_node)
+    ]
+    remove_points.sort()
 
     # Reconstruct the code, skipping over the parts to remove
     cleaned_code = []
     last_index = 0
-    for start, end in sorted(remove_points):
+    for start, end in remove_points:
         if last_index < start:
             cleaned_code.append(code[last_index:start])
-        last_index = end
+        last_index = max(last_index, end)
 
     # Add any remaining code after the last comment/docstring
     cleaned_code.append(code[last_index:])
@@ -99,9 +150,71 @@ def clean_code_string(code: str) -> str:
     code = remove_extra_newlines(code)
     return code
 
+
+def clean_code_chunk(codes: List[str]) -> List[str]:
+    return [clean_code_string(code) for code in codes]
+
+
+def clean_code_strings(codes: List[str], chunk_size: int = 1000) -> List[str]:
+    """
+    Clean many snippets at once, spreading large batches over a process pool in chunks.
+    """
+    if len(codes) <= chunk_size:
+        return clean_code_chunk(codes)
+    chunks = [codes[i : i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    results = Parallel(n_jobs=-1)(delayed(clean_code_chunk)(chunk) for chunk in chunks)
+    return [code for chunk in results for code in chunk]
+
+class CaseComparison(BaseModel):
+    """Per-case outcome of comparing a program's output with the expected output."""
+    cases: List[bool]
+    extra_lines: int = 0
+    # blank lines and cases printed out of order, which the exact check rejects
+    format_errors: int = 0
+
+    @property
+    def total_cases(self) -> int:
+        return len(self.cases)
+
+    @property
+    def passed_cases(self) -> int:
+        return sum(self.cases)
+
+    @property
+    def first_failure(self) -> Optional[int]:
+        return next((i for i, passed in enumerate(self.cases) if not passed), None)
+
+    @property
+    def passed(self) -> bool:
+        return all(self.cases) and not self.extra_lines and not self.format_errors
+
 class TestReport(BaseModel):
     status: str
     message: str
+    runtime: Optional[float] = None
+    comparison: Optional[CaseComparison] = None
+
+    @property
+    def passed_cases(self) -> int:
+        return self.comparison.passed_cases if self.comparison else 0
+
+    @property
+    def total_cases(self) -> int:
+        return self.comparison.total_cases if self.comparison else 0
+
+    @property
+    def partial_credit(self) -> float:
+        """
+        Fraction of `Case #i` lines the program got right. Output that is right case by case but
+        still fails (reordered cases, blank lines) gets half a case less than full credit, so it
+        never ties with a passing program.
+        """
+        if not self.total_cases:
+            return 0.0
+        credit = self.passed_cases / self.total_cases
+        if self.status != "passed" and credit == 1.0:
+            credit = (self.total_cases - 0.5) / self.total_cases
+        return credit
 
     @property
     def as_xml(self) -> str:
@@ -112,6 +225,30 @@ class TestReport(BaseModel):
 </test_report>
 """
 
+CASE_PATTERN = re.compile(r"Case #(\d+): (.+)")
+
+def compare_values(expected: str, actual: str, tolerance: float = 1e-9) -> bool:
+    """
+    Compare the answers of a single case with a tolerance for floating point numbers.
+    """
+    expected_values = expected.split()
+    actual_values = actual.split()
+
+    if len(expected_values) != len(actual_values):
+        return False
+
+    for expected_value, actual_value in zip(expected_values, actual_values):
+        try:
+            expected_float = float(expected_value)
+            actual_float = float(actual_value)
+            if not math.isclose(expected_float, actual_float, rel_tol=tolerance):
+                return False
+        except ValueError:
+            if expected_value != actual_value:
+                return False
+
+    return True
+
 def compare_lines_with_tolerance(expected: str, actual: str, tolerance: float = 1e-9) -> bool:
     """
     Compare two lines of output with a tolerance for floating point numbers.
@@ -123,32 +260,60 @@ def compare_lines_with_tolerance(expected: str, actual: str, tolerance: float =
         return False
 
     for expected_line, actual_line in zip(expected_lines, actual_lines):
-        expected_match = re.match(r"Case #\d+: (.+)", expected_line)
-        actual_match = re.match(r"Case #\d+: (.+)", actual_line)
+        expected_match = CASE_PATTERN.match(expected_line)
+        actual_match = CASE_PATTERN.match(actual_line)
 
         if not expected_match or not actual_match:
             return False
 
-        expected_values = expected_match.group(1).split()
-        actual_values = actual_match.group(1).split()
-
-        if len(expected_values) != len(actual_values):
+        if not compare_values(expected_match.group(2), actual_match.group(2), tolerance):
             return False
 
-        for expected_value, actual_value in zip(expected_values, actual_values):
-            try:
-                expected_float = float(expected_value)
-                actual_float = float(actual_value)
-                if not math.isclose(expected_float, actual_float, rel_tol=tolerance):
-                    return False
-            except ValueError:
-                if expected_value != actual_value:
-                    return False
-
     return True
 
+def compare_cases(expected: str, actual: str, tolerance: float = 1e-9) -> CaseComparison:
+    """
+    Compare the output case by case. Cases are matched by their `Case #i` number, so a
+    missing or reordered line only fails the cases it affects, while blank lines and cases
+    printed out of order are counted as format errors.
+    """
+    expected_lines = expected.strip().split('\n')
+    actual_cases = {}
+    extra_lines = 0
+    format_errors = 0
+    for line in actual.strip().split('\n'):
+        match = CASE_PATTERN.match(line)
+        if match and match.group(1) not in actual_cases:
+            actual_cases[match.group(1)] = match.group(2)
+        elif line.strip():
+            extra_lines += 1
+        elif actual.strip():
+            format_errors += 1
+
+    expected_ids = [m.group(1) for m in map(CASE_PATTERN.match, expected_lines) if m]
+    expected_set = set(expected_ids)
+    actual_order = [case for case in actual_cases if case in expected_set]
+    expected_order = [case for case in expected_ids if case in actual_cases]
+    format_errors += sum(a != e for a, e in zip(actual_order, expected_order))
+
+    cases = []
+    for expected_line in expected_lines:
+        expected_match = CASE_PATTERN.match(expected_line)
+        if not expected_match:
+            cases.append(False)
+            continue
+        actual_value = actual_cases.pop(expected_match.group(1), None)
+        cases.append(
+            actual_value is not None
+            and compare_values(expected_match.group(2), actual_value, tolerance)
+        )
+    return CaseComparison(
+        cases=cases, extra_lines=extra_lines + len(actual_cases), format_errors=format_errors
+    )
+
 async def exec_program(program, input_data, expected_output, timeout):
     try:
+        start = time.perf_counter()
         process = await asyncio.create_subprocess_exec(
             sys.executable, "-c", program,
             stdin=asyncio.subprocess.PIPE,
@@ -158,40 +323,167 @@ async def exec_program(program, input_data, expected_output, timeout):
         
         try:
             stdout, stderr = await asyncio.wait_for(process.communicate(input=input_data.encode()), timeout=timeout)
+        except asyncio.CancelledError:
+            # don't leave the program running when a speculative branch is cancelled
+            process.kill()
+            raise
         except asyncio.TimeoutError:
             process.kill()
             return TestReport(
                 status="timeout",
-                message=f"Took too long! Your program timed out after {timeout} seconds of execution."
+                message=f"Took too long! Your program timed out after {timeout} seconds of execution.",
+                runtime=timeout,
+                comparison=compare_cases(expected_output, ""),
             )
+        runtime = time.perf_counter() - start
         
         if process.returncode != 0:
             return TestReport(
-                status="error", message=f"Program execution failed: {stderr.decode()}"
+                status="error",
+                message=f"Program execution failed: {stderr.decode()}",
+                runtime=runtime,
+                # cases printed before the crash still count
+                comparison=compare_cases(expected_output, stdout.decode()),
             )
         else:
+            # the boolean comparison is cheaper and covers the common all-passed case
             if compare_lines_with_tolerance(expected_output, stdout.decode()):
+                num_cases = len(expected_output.strip().split('\n'))
                 return TestReport(
-                    status="passed", message="Yay! Your program ran successfully"
+                    status="passed",
+                    message="Yay! Your program ran successfully",
+                    runtime=runtime,
+                    comparison=CaseComparison(cases=[True] * num_cases),
                 )
             else:
                 return TestReport(
                     status="failed",
                     message=f"<expected>\n{expected_output}</expected>\n---\n<got>\n{stdout.decode()}</got>",
+                    runtime=runtime,
+                    comparison=compare_cases(expected_output, stdout.decode()),
                 )
     except Exception:
         return TestReport(
             status="error", message=f"An error occurred: {traceback.format_exc()}"
         )
 
-@weave.op
+@traced_op
 async def check_correctness(
     program: str, input_data: str, expected_output: str, timeout: float
 ) -> TestReport:
-    return await exec_program(program, input_data, expected_output, timeout)
+    async with concurrency_slot("sandbox"):
+        with metrics.timer("check_correctness"):
+            test_report = await exec_program(program, input_data, expected_output, timeout)
+    metrics.inc("test_reports", status=test_report.status)
+    return test_report
+
+
+class PatchError(ValueError):
+    """Raised when a model's patch can't be applied to the code it was written against."""
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DIFF_BLOCK = re.compile(r"```(?:diff|patch)?\s*\n(.*?)```", re.DOTALL)
+
+
+def number_lines(code: str) -> str:
+    return "\n".join(f"{i:>4} | {line}" for i, line in enumerate(code.split("\n"), start=1))
+
+
+def parse_hunks(patch: str) -> List[tuple]:
+    """(old start line, hunk lines) for every hunk of a unified diff."""
+    match = DIFF_BLOCK.search(patch)
+    if match:
+        patch = match.group(1)
+    hunks = []
+    for line in patch.split("\n"):
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunks.append((int(header.group(1)), []))
+        elif not hunks or line.startswith("\\"):
+            # file headers and "\ No newline at end of file"
+            continue
+        elif line[:1] in (" ", "+", "-"):
+            hunks[-1][1].append(line)
+        elif not line.strip():
+            # context blank lines often lose their leading space
+            hunks[-1][1].append(" ")
+    for _, lines in hunks:
+        # trailing blank context is usually just the gap before the next hunk
+        while lines and lines[-1] == " ":
+            lines.pop()
+    return [(start, lines) for start, lines in hunks if lines]
+
+
+def find_block(lines: List[str], block: List[str], expected: int) -> int:
+    """Index where `block` occurs in `lines`, preferring the one closest to `expected`."""
+    stripped = [line.rstrip() for line in lines]
+    target = [line.rstrip() for line in block]
+    positions = sorted(range(len(lines) - len(block) + 1), key=lambda i: abs(i - expected))
+    for position in positions:
+        if stripped[position : position + len(block)] == target:
+            return position
+    raise PatchError(f"hunk at line {expected + 1} does not match the code")
+
+
+def apply_patch(code: str, patch: str) -> str:
+    """
+    Applies a unified diff to `code`, tolerating wrong line numbers by locating each hunk by its
+    context. The patched code must still compile.
+    """
+    hunks = parse_hunks(patch)
+    if not hunks:
+        raise PatchError("no hunks found in the patch")
+    lines = code.split("\n")
+    offset = 0
+    for start, hunk in hunks:
+        old = [line[1:] for line in hunk if line[0] in (" ", "-")]
+        new = [line[1:] for line in hunk if line[0] in (" ", "+")]
+        if old:
+            position = find_block(lines, old, start - 1 + offset)
+        else:
+            # pure insertion after line `start`
+            position = min(max(start + offset, 0), len(lines))
+        lines[position : position + len(old)] = new
+        offset += len(new) - len(old)
+    patched = "\n".join(lines)
+    try:
+        compile(patched, "<patched>", "exec")
+    except SyntaxError as e:
+        raise PatchError(f"patched code does not compile: {e}") from e
+    return patched
+
+
+def compact_test_report(test_report: Any, max_lines: int = 20, max_chars: int = 2000) -> str:
+    """
+    A bounded version of a test report for refinement prompts: a diff of the first mismatching
+    lines for wrong answers, the tail of the message (where tracebacks end) otherwise.
+    """
+    if not isinstance(test_report, TestReport):
+        return str(test_report)[-max_chars:]
+    match = re.search(r"<expected>\n(.*)</expected>\n---\n<got>\n(.*)</got>", test_report.message, re.DOTALL)
+    if test_report.status != "failed" or not match:
+        return f"status: {test_report.status}\n{test_report.message[-max_chars:]}"
+
+    diff = list(
+        difflib.unified_diff(
+            match.group(1).strip().split("\n"),
+            match.group(2).strip().split("\n"),
+            "expected",
+            "got",
+            lineterm="",
+            n=0,
+        )
+    )
+    summary = f"status: failed, {test_report.passed_cases}/{test_report.total_cases} cases passed"
+    if test_report.comparison and test_report.comparison.first_failure is not None:
+        summary += f", first failing case #{test_report.comparison.first_failure + 1}"
+    if len(diff) > max_lines:
+        diff = diff[:max_lines] + [f"... {len(diff) - max_lines} more diff lines"]
+    return summary + "\n" + "\n".join(diff)[:max_chars]
 
 
-@weave.op
+@traced_op
 async def format_response(text: str, model: Any, temperature: float = 0.1) -> Any:
     formatted_response = await async_client.chat.completions.create(
         model=FAST_LLM,
@@ -275,7 +567,14 @@ class Problem(BaseModel):
             problem_output=output_path if output_path else input_path.with_suffix('.out'),
             problem_dir=input_path.parent,
         )
-    
+
+
+# nested ops all receive the same problem, so traces only record which one it is
+capture_by_reference(
+    Problem, lambda p: {"problem_name": p.problem_name, "problem_dir": str(p.problem_dir)}
+)
+
+
 def find_problems(folder: Path) -> list[dict]:
     """
     Find all the problems in the given folder.
@@ -387,6 +686,18 @@ class Reflection(BaseModel):
 </root>
 """
 
+    @property
+    def actionable_xml(self) -> str:
+        """Only the fields that say what to change, for compact refinement prompts."""
+        return f"""
+<keywords>
+{self.keywords}
+</keywords>
+<instructions>
+{self.instructions}
+</instructions>
+"""
+
 
 def format_example(example: dict) -> str:
     formatted_doc = f"""
@@ -402,7 +713,113 @@ def format_example(example: dict) -> str:
     return formatted_doc
 
 
-def format_examples(examples: List[dict], analyses: List[Analysis]) -> str:
+@lru_cache(maxsize=1)
+def get_tokenizer() -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.get_encoding(EXEMPLAR_TOKENIZER)
+    except Exception as e:
+        logging.warning(f"Could not load tokenizer {EXEMPLAR_TOKENIZER}, estimating 4 chars per token: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return math.ceil(len(text) / 4)
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        truncated = text[: max_tokens * 4]
+    else:
+        tokens = tokenizer.encode(text, disallowed_special=())
+        truncated = tokenizer.decode(tokens[:max_tokens])
+    return text if len(truncated) == len(text) else truncated.rstrip() + "\n[...truncated]"
+
+
+# analysis fields in the order they are added to exemplars once every exemplar's problem
+# statement and source code is in, most useful first
+ANALYSIS_FIELD_PRIORITY = [
+    "algorithm",
+    "plan",
+    "pseudocode",
+    "core_question",
+    "problem_solving_info",
+    "tutorial",
+]
+# longest any single exemplar section may be before it is truncated
+SECTION_TOKEN_LIMITS = {"description": 800, "analysis": 300}
+
+
+def format_packed_example(description: str, fields: Dict[str, str], code: str) -> str:
+    formatted_fields = "".join(
+        f"<{name}>\n{fields[name]}\n</{name}>\n"
+        for name in Analysis.model_fields
+        if name in fields
+    )
+    return f"""
+<example>
+<problem>
+<problem_statement>
+{description}
+</problem_statement>
+</problem>
+
+<root>
+{formatted_fields}<source_code>
+{code}
+</source_code>
+</root>
+</example>
+"""
+
+
+def pack_examples(examples: List[dict], analyses: List[Analysis], token_budget: int) -> str:
+    """
+    Fits exemplars into `token_budget` tokens. Every exemplar that fits gets its (truncated)
+    problem statement and full source code first, in rank order, so as many exemplars as possible
+    are kept. The remaining budget is filled with analysis fields in order of usefulness.
+    """
+    wrapper_tokens = count_tokens(format_packed_example("", {}, ""))
+    packed = []
+    used = 0
+    for example, analysis in zip(examples, analyses):
+        description = truncate_tokens(example["description"], SECTION_TOKEN_LIMITS["description"])
+        cost = wrapper_tokens + count_tokens(description) + count_tokens(example["code"])
+        if used + cost > token_budget:
+            continue
+        used += cost
+        packed.append((description, {}, example["code"], analysis))
+
+    for name in ANALYSIS_FIELD_PRIORITY:
+        for _, fields, _, analysis in packed:
+            value = truncate_tokens(str(getattr(analysis, name)), SECTION_TOKEN_LIMITS["analysis"])
+            cost = count_tokens(f"<{name}>\n{value}\n</{name}>\n")
+            if used + cost <= token_budget:
+                fields[name] = value
+                used += cost
+
+    logging.info(
+        f"Packed {len(packed)} of {len(examples)} exemplars into {used} of {token_budget} tokens"
+    )
+    messages = "".join(
+        format_packed_example(description, fields, code)
+        for description, fields, code, _ in packed
+    )
+    return messages.strip()
+
+
+def format_examples(
+    examples: List[dict],
+    analyses: List[Analysis],
+    token_budget: Optional[int] = EXEMPLAR_TOKEN_BUDGET,
+) -> str:
+    """Formats exemplars for the solver prompt, packed into `token_budget` tokens unless it is None."""
+    if token_budget is not None:
+        return pack_examples(examples, analyses, token_budget)
+
     def format_question(example: dict) -> str:
         return f"""
 <problem>